@@ -0,0 +1,84 @@
+"""Compares the decoding of Druid query results into DataFrames
+
+Pits the column by column decoding of the Druid connector against
+pydruid's ``export_pandas`` followed by the parsing of its timestamps, on
+synthetic groupBy, topN and timeseries responses.
+Usage: python scripts/benchmark_druid_results.py [rows] [dims]
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import json
+import random
+import sys
+import timeit
+
+from pydruid.query import Query
+
+from superset.connectors.druid.models import DruidDatasource, results_to_df
+
+
+def make_event(dims):
+    event = {
+        'dim_{}'.format(i): random.choice(['foo', 'bar', 'baz', None])
+        for i in range(dims)}
+    event['count'] = random.randint(0, 1000)
+    event['sum__num'] = random.random() * 1000
+    return event
+
+
+def make_response(query_type, rows, dims, buckets=100):
+    start = datetime(2017, 1, 1)
+    timestamps = [
+        (start + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        for i in range(buckets)]
+    if query_type == 'groupBy':
+        result = [{
+            'version': 'v1',
+            'timestamp': timestamps[i % buckets],
+            'event': make_event(dims),
+        } for i in range(rows)]
+    elif query_type == 'topN':
+        result = [{
+            'timestamp': ts,
+            'result': [make_event(1) for _ in range(rows // buckets)],
+        } for ts in timestamps]
+    else:
+        result = [{
+            'timestamp': (start + timedelta(minutes=i)).strftime(
+                '%Y-%m-%dT%H:%M:%S.000Z'),
+            'result': make_event(0),
+        } for i in range(rows)]
+    return json.dumps(result)
+
+
+def export_pandas(query):
+    df = query.export_pandas()
+    df['timestamp'] = DruidDatasource.parse_timestamps(df['timestamp'])
+    return df
+
+
+def benchmark(name, decode, number=3):
+    duration = timeit.timeit(decode, number=number) / number
+    print('{:<30}{:>12.1f}'.format(name, duration * 1000))
+
+
+def main(rows=100000, dims=3):
+    print('{} rows, {} dimensions'.format(rows, dims))
+    print('{:<30}{:>12}'.format('decoder', 'ms'))
+    for query_type in ('groupBy', 'topN', 'timeseries'):
+        query = Query({}, query_type)
+        query.parse(make_response(query_type, rows, dims))
+        benchmark(
+            '{} export_pandas'.format(query_type),
+            lambda: export_pandas(query))
+        benchmark(
+            '{} results_to_df'.format(query_type),
+            lambda: results_to_df(query))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""Compares the serialization of query results stored in caches
+
+Pits the available DataFrame formats and compressors against the zlib
+compressed JSON records the results used to be stored as, on a synthetic
+result set. Usage: python scripts/benchmark_serialization.py [rows] [cols]
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from superset import dataframe, serialization, utils
+
+
+def make_df(rows, cols):
+    data = {}
+    for i in range(cols):
+        if i % 3 == 0:
+            data['name_{}'.format(i)] = np.random.choice(
+                ['foo', 'bar', 'baz', 'qux'], rows)
+        elif i % 3 == 1:
+            data['num_{}'.format(i)] = np.random.randint(0, 1000, rows)
+        else:
+            data['ratio_{}'.format(i)] = np.random.rand(rows)
+    return pd.DataFrame(data)
+
+
+def benchmark(name, dumps, loads, number=3):
+    blob = dumps()
+    encode = timeit.timeit(dumps, number=number) / number
+    decode = timeit.timeit(lambda: loads(blob), number=number) / number
+    print('{:<20}{:>12,}{:>12.1f}{:>12.1f}'.format(
+        name, len(blob), encode * 1000, decode * 1000))
+
+
+def main(rows=100000, cols=12):
+    df = make_df(rows, cols)
+    print('{} rows, {} columns'.format(rows, cols))
+    print('{:<20}{:>12}{:>12}{:>12}'.format(
+        'format', 'bytes', 'encode ms', 'decode ms'))
+
+    def legacy_dumps():
+        payload = {'data': dataframe.SupersetDataFrame(df).data}
+        return utils.zlib_compress(
+            json.dumps(payload, default=utils.json_iso_dttm_ser))
+
+    def legacy_loads(blob):
+        obj = json.loads(utils.zlib_uncompress_to_string(blob))
+        return pd.DataFrame.from_records(obj['data'])
+
+    benchmark('json:zlib', legacy_dumps, legacy_loads)
+    for fmt in sorted(serialization.FORMATS):
+        for compressor in sorted(serialization.COMPRESSORS):
+            benchmark(
+                '{}:{}'.format(fmt, compressor),
+                lambda: serialization.serialize(
+                    '{}', df, fmt=fmt, compressor=compressor),
+                serialization.deserialize)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
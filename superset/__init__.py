@@ -53,6 +53,8 @@ utils.pessimistic_connection_handling(db.engine.pool)
 
 cache = utils.setup_cache(app, conf.get('CACHE_CONFIG'))
 tables_cache = utils.setup_cache(app, conf.get('TABLE_NAMES_CACHE_CONFIG'))
+query_results_cache = utils.setup_cache(
+    app, conf.get('QUERY_RESULTS_CACHE_CONFIG'))
 
 migrate = Migrate(app, db, directory=APP_DIR + "/migrations")
 
@@ -46,8 +46,11 @@ class ResultSet extends React.PureComponent {
         this.clearQueryResults(nextProps.query)
       );
     }
-    if (nextProps.query.resultsKey
-      && nextProps.query.resultsKey !== this.props.query.resultsKey) {
+    // the first pages of the results are published while the query runs,
+    // they are fetched once it succeeded
+    if (nextProps.query.resultsKey && nextProps.query.state === 'success'
+      && (nextProps.query.resultsKey !== this.props.query.resultsKey
+        || ['success', 'fetching'].indexOf(this.props.query.state) < 0)) {
       this.fetchResults(nextProps.query);
     }
   }
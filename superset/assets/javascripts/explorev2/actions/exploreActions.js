@@ -144,10 +144,30 @@ export const CHART_UPDATE_STOPPED = 'CHART_UPDATE_STOPPED';
 export function chartUpdateStopped(queryRequest) {
   if (queryRequest) {
     queryRequest.abort();
+    if (queryRequest.cancelQuery) {
+      queryRequest.cancelQuery();
+    }
   }
   return { type: CHART_UPDATE_STOPPED };
 }
 
+// Asks the datasource to cancel the queries of an aborted chart request,
+// through a beacon when the page is being unloaded
+export function cancelDatasourceQuery(formData, queryId, beacon = false) {
+  const [datasourceId, datasourceType] = formData.datasource.split('__');
+  if (datasourceType !== 'druid') {
+    return;
+  }
+  const url = `/superset/cancel_query/${datasourceType}/${datasourceId}/`;
+  if (beacon && navigator.sendBeacon) {
+    const data = new FormData();
+    data.append('query_id', queryId);
+    navigator.sendBeacon(url, data);
+  } else {
+    $.post(url, { query_id: queryId });
+  }
+}
+
 export const CHART_UPDATE_FAILED = 'CHART_UPDATE_FAILED';
 export function chartUpdateFailed(queryResponse) {
   return { type: CHART_UPDATE_FAILED, queryResponse };
@@ -231,7 +251,9 @@ export function updateChartStatus(status) {
 export const RUN_QUERY = 'RUN_QUERY';
 export function runQuery(formData, force = false) {
   return function (dispatch) {
-    const url = getExploreUrl(formData, 'json', force);
+    const queryId = `superset_${Date.now()}_${Math.random().toString(36).slice(2)}`;
+    const url = getExploreUrl(
+      Object.assign({}, formData, { query_id: queryId }), 'json', force);
     const queryRequest = $.getJSON(url, function (queryResponse) {
       dispatch(chartUpdateSucceeded(queryResponse));
     }).fail(function (err) {
@@ -239,6 +261,9 @@ export function runQuery(formData, force = false) {
         dispatch(chartUpdateFailed(err.responseJSON));
       }
     });
+    queryRequest.cancelQuery = function (beacon) {
+      cancelDatasourceQuery(formData, queryId, beacon);
+    };
     dispatch(chartUpdateStarted(queryRequest));
   };
 }
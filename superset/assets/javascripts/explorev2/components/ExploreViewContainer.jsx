@@ -29,11 +29,13 @@ class ExploreViewContainer extends React.Component {
       height: this.getHeight(),
       showModal: false,
     };
+    this.handleUnload = this.handleUnload.bind(this);
   }
 
   componentDidMount() {
     this.props.actions.fetchDatasources();
     window.addEventListener('resize', this.handleResize.bind(this));
+    window.addEventListener('beforeunload', this.handleUnload);
   }
 
   componentWillReceiveProps(np) {
@@ -54,6 +56,7 @@ class ExploreViewContainer extends React.Component {
 
   componentWillUnmount() {
     window.removeEventListener('resize', this.handleResize.bind(this));
+    window.removeEventListener('beforeunload', this.handleUnload);
   }
 
   onQuery() {
@@ -85,6 +88,15 @@ class ExploreViewContainer extends React.Component {
     this.props.actions.runQuery(this.props.form_data);
   }
 
+  handleUnload() {
+    // the queries of a chart still loading would keep running otherwise
+    const queryRequest = this.props.queryRequest;
+    if (this.props.chartStatus === 'loading' && queryRequest &&
+        queryRequest.cancelQuery) {
+      queryRequest.cancelQuery(true);
+    }
+  }
+
   handleResize() {
     clearTimeout(this.resizeTimer);
     this.resizeTimer = setTimeout(() => {
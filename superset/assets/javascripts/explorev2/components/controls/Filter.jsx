@@ -28,7 +28,7 @@ export default class Filter extends React.Component {
   constructor(props) {
     super(props);
     const filterOps = props.datasource.type === 'table' ?
-      ['in', 'not in'] : ['==', '!=', 'in', 'not in', 'regex'];
+      ['in', 'not in'] : ['==', '!=', '>', '<', '>=', '<=', 'in', 'not in', 'regex'];
     this.opChoices = this.props.having ? ['==', '!=', '>', '<', '>=', '<=']
       : filterOps;
   }
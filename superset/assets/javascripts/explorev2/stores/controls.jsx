@@ -346,6 +346,15 @@ export const controls = {
                  'accepts natural dates as in `now`, `sunday` or `1970-01-01`',
   },
 
+  druid_query_context: {
+    type: 'TextControl',
+    label: 'Query Context',
+    default: '',
+    description: 'A JSON object of Druid query context keys, as in ' +
+                 '`{"timeout": 60000, "priority": 1}`, overriding the ' +
+                 'defaults of the datasource and of its cluster',
+  },
+
   bottom_margin: {
     type: 'SelectControl',
     freeForm: true,
@@ -31,6 +31,13 @@ export const commonControlPanelSections = {
     ],
     description: 'This section exposes ways to include snippets of SQL in your query',
   },
+  druidQueryContext: {
+    label: 'Druid Query',
+    controlSetRows: [
+      ['druid_query_context'],
+    ],
+    description: 'Settings of the queries sent to Druid',
+  },
   NVD3TimeSeries: [
     {
       label: null,
@@ -763,14 +770,18 @@ export function sectionsToRender(vizType, datasourceType) {
   const viz = visTypes[vizType];
   const timeSection = datasourceType === 'table' ?
     commonControlPanelSections.sqlaTimeSeries : commonControlPanelSections.druidTimeSeries;
-  const { datasourceAndVizType, sqlClause, filters } = commonControlPanelSections;
+  const {
+    datasourceAndVizType, sqlClause, druidQueryContext, filters,
+  } = commonControlPanelSections;
   const filtersToRender =
     datasourceType === 'table' ? filters[0] : filters;
+  const querySections =
+    datasourceType === 'table' ? sqlClause : [sqlClause, druidQueryContext];
   return [].concat(
     datasourceAndVizType,
     timeSection,
     viz.controlPanelSections,
-    sqlClause,
+    querySections,
     filtersToRender
   );
 }
@@ -59,6 +59,16 @@ const addTotalBarValues = function (chart, data, stacked) {
     });
 };
 
+// Time series can come in a compact format where the series share the x
+// values, see the series_format form data key
+function expandColumnarSeries(data) {
+  return data.series.map(series => ({
+    key: series.key,
+    classed: series.classed,
+    values: series.y.map((y, i) => ({ x: data.x[i], y })),
+  }));
+}
+
 function hideTooltips() {
   $('.nvtooltip').css({ opacity: 0 });
 }
@@ -79,6 +89,9 @@ function nvd3Vis(slice, payload) {
 
   slice.container.html('');
   slice.clearError();
+  if (payload.data && payload.data.series) {
+    payload.data = expandColumnarSeries(payload.data);
+  }
 
   // Calculates the longest label size for stretching bottom margin
   function calculateStretchMargins(payloadData) {
@@ -1,3 +1,5 @@
+import uuid
+
 from superset import tables_cache
 from flask import request
 
@@ -30,3 +32,25 @@ def memoized_func(timeout=5 * 60, key=view_cache_key):
                 return f(cls, *args, **kwargs)
         return wrapped_f
     return wrap
+
+
+def lock_key(key):
+    return 'lock__{}'.format(key)
+
+
+def acquire_lock(cache, key, timeout):
+    """Takes a lock on ``key`` shared by all the processes using ``cache``
+
+    Relies on ``add`` being atomic in the cache backend, which is the case
+    for memcached and redis. Returns the token needed to release the lock,
+    or ``None`` if someone else is holding it. The lock expires after
+    ``timeout`` seconds in case its holder dies.
+    """
+    token = uuid.uuid4().hex
+    if cache.add(lock_key(key), token, timeout=timeout):
+        return token
+
+
+def release_lock(cache, key, token):
+    if cache.get(lock_key(key)) == token:
+        cache.delete(lock_key(key))
@@ -15,6 +15,10 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
     # Used to do code highlighting when displaying the query in the UI
     query_language = None
 
+    # Time zone of the timestamps the time bounds of queries are in, when
+    # not the one of the naive timestamps returned by queries
+    time_slice_tz = None
+
     @property
     def column_names(self):
         return sorted([c.column_name for c in self.columns])
@@ -85,6 +89,31 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
             d['time_grain_sqla'] = grains
         return d
 
+    def get_query_signature(self, query_obj):
+        """Identifies the query run for ``query_obj``, to cache its results"""
+        raise NotImplementedError()
+
+    def is_time_sliceable(self, query_obj):
+        """Whether the timeseries of ``query_obj`` can be queried by day
+
+        That is when no time bucket of the series spans two days, so that
+        the results for an interval are the ones of its days put together.
+        """
+        return False
+
+    def query_time_slice(self, query_obj):
+        """Runs ``query_obj`` for a slice of the interval of a timeseries
+
+        Unlike ``query``, no data isn't an error as the interval is
+        partial. ``extras['to_dttm_exclusive']`` is set when the upper
+        bound of ``query_obj`` is the lower bound of the next slice.
+        """
+        return self.query(query_obj)
+
+    def cancel_query(self, query_id):
+        """Cancels the queries run for the ``query_id`` of a query object"""
+        raise NotImplementedError()
+
 
 class BaseColumn(AuditMixinNullable, ImportMixin):
     """Interface for column"""
@@ -1,10 +1,16 @@
 from collections import OrderedDict
+import hashlib
 import json
 import logging
+import os
+import threading
 from copy import deepcopy
 from datetime import datetime, timedelta
-from six import string_types
+from multiprocessing.pool import ThreadPool
+from six import string_types, text_type
+from six.moves.urllib.parse import quote
 
+import pandas as pd
 import requests
 import sqlalchemy as sa
 from sqlalchemy import (
@@ -15,8 +21,9 @@ from sqlalchemy.orm import backref, relationship
 from dateutil.parser import parse as dparse
 
 from pydruid.client import PyDruid
+from pydruid.query import Query
 from pydruid.utils.aggregators import count
-from pydruid.utils.filters import Dimension, Filter
+from pydruid.utils.filters import Bound, Dimension, Filter
 from pydruid.utils.postaggregator import (
     Postaggregator, Quantile, Quantiles, Field, Const, HyperUniqueCardinality,
 )
@@ -28,7 +35,8 @@ from flask_appbuilder import Model
 
 from flask_babel import lazy_gettext as _
 
-from superset import conf, db, import_util, utils, sm, get_session
+from superset import (
+    conf, db, import_util, query_results_cache, utils, sm, get_session)
 from superset.utils import (
     flasher, MetricPermException, DimSelector, DTTM_ALIAS
 )
@@ -36,6 +44,28 @@ from superset.connectors.base import BaseDatasource, BaseColumn, BaseMetric
 from superset.models.helpers import AuditMixinNullable, QueryResult, set_perm
 
 DRUID_TZ = conf.get("DRUID_TZ")
+# the first Druid versions supporting these filters
+IN_FILTER_VERSION = '0.9.0'
+BOUND_FILTER_VERSION = '0.9.1'
+# how the aggregators of queries split by interval add up over sub-intervals
+SPLIT_AGGREGATIONS = {
+    'count': 'sum',
+    'longSum': 'sum',
+    'doubleSum': 'sum',
+    'floatSum': 'sum',
+    'longMin': 'min',
+    'doubleMin': 'min',
+    'floatMin': 'min',
+    'longMax': 'max',
+    'doubleMax': 'max',
+    'floatMax': 'max',
+}
+
+# stands for the null dimension values of split results while grouping them
+_NULL_KEY = '__superset_null__'
+
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
 
 
 class JavascriptPostAggregator(Postaggregator):
@@ -49,6 +79,140 @@ class JavascriptPostAggregator(Postaggregator):
         self.name = name
 
 
+def _combine_filters(filter_type, filters):
+    fields = []
+    for flt in filters:
+        if flt is None:
+            continue
+        spec = flt.filter['filter']
+        if spec['type'] == filter_type:
+            fields += spec['fields']
+        else:
+            fields.append(flt)
+    if not fields:
+        return None
+    if len(fields) == 1:
+        return fields[0]
+    return Filter(type=filter_type, fields=fields)
+
+
+def and_filters(filters):
+    """Combines filters in a single flat ``and``, skipping the ``None`` ones
+
+    >>> f = and_filters([Dimension('a') == 1, None, and_filters([
+    ...     Dimension('b') == 2, Dimension('c') == 3])])
+    >>> [fld.filter['filter']['dimension'] for fld in f.filter['filter']['fields']]
+    ['a', 'b', 'c']
+    >>> and_filters([None]) is None
+    True
+    """
+    return _combine_filters('and', filters)
+
+
+def or_filters(filters):
+    """Combines filters in a single flat ``or``, skipping the ``None`` ones"""
+    return _combine_filters('or', filters)
+
+
+def results_to_df(query):
+    """Builds a DataFrame of the results of a PyDruid ``query`` by column
+
+    Unlike ``Query.export_pandas``, rows aren't copied into dicts along
+    with their timestamp for the DataFrame to infer columns from: the
+    values of each column are gathered at once, and timestamps are parsed
+    into a datetime column.
+    """
+    result = query.result
+    if not result:
+        return None
+    if query.query_type == 'timeseries':
+        timestamps = [row['timestamp'] for row in result]
+        events = [row['result'] for row in result]
+    elif query.query_type == 'topN':
+        timestamps = [
+            row['timestamp'] for row in result for _ in row['result']]
+        events = [event for row in result for event in row['result']]
+    elif query.query_type == 'groupBy':
+        timestamps = [row['timestamp'] for row in result]
+        events = [row['event'] for row in result]
+    else:
+        return query.export_pandas()
+    # null values can be left out of events
+    columns = sorted(set().union(*events))
+    data = {
+        col: [event.get(col) for event in events] for col in columns}
+    data['timestamp'] = DruidDatasource.parse_timestamps(timestamps)
+    return pd.DataFrame(data, columns=columns + ['timestamp'])
+
+
+def truncate_intervals(intervals, grain=None):
+    """Truncates the bounds of Druid ``intervals`` to the start of ``grain``"""
+    return '/'.join(
+        utils.truncate_dttm(dparse(dttm), grain).isoformat()
+        for dttm in intervals.split('/'))
+
+
+def get_http_session(key):
+    """Returns the keep-alive HTTP session shared by the threads for ``key``
+
+    Sessions are kept per process id, as the connections of a session
+    inherited through a fork are the sockets of the parent process.
+    """
+    key = (os.getpid(), key)
+    with _http_sessions_lock:
+        session = _http_sessions.get(key)
+        if session is None:
+            pool_size = conf.get('DRUID_HTTP_POOL_SIZE')
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_sessions[key] = session
+        return session
+
+
+class DruidClient(PyDruid):
+
+    """PyDruid client posting its queries through a pooled HTTP session"""
+
+    def __init__(self, url, endpoint, session, timeout=None):
+        super(DruidClient, self).__init__(url, endpoint)
+        self.session = session
+        self.timeout = timeout
+
+    def _post(self, query):
+        headers, querystr, url = self._prepare_url_headers_and_body(query)
+        res = self.session.post(
+            url, data=querystr, headers=headers, timeout=self.timeout)
+        if not res.ok:
+            err = None
+            if res.status_code == 500:
+                # has Druid returned an error?
+                try:
+                    err = res.json().get('error')
+                except (ValueError, AttributeError):
+                    pass
+            raise IOError('HTTP Error {0}: {1} \n Druid Error: {2} \n '
+                          'Query is: {3}'.format(
+                              res.status_code, res.reason, err,
+                              json.dumps(query.query_dict, indent=4)))
+        query.parse(res.text)
+        return query
+
+    def export_pandas(self):
+        if self.query_builder.last_query:
+            return results_to_df(self.query_builder.last_query)
+
+
+class DeferredDruidClient(PyDruid):
+
+    """PyDruid client building its queries without running them"""
+
+    def _post(self, query):
+        return query
+
+
 class DruidCluster(Model, AuditMixinNullable):
 
     """ORM object referencing the Druid clusters"""
@@ -67,39 +231,95 @@ class DruidCluster(Model, AuditMixinNullable):
     broker_endpoint = Column(String(255), default='druid/v2')
     metadata_last_refreshed = Column(DateTime)
     cache_timeout = Column(Integer)
+    serve_stale_cache = Column(Boolean, default=False)
+    druid_version = Column(String(32))
+    query_context = Column(Text)
 
     def __repr__(self):
         return self.cluster_name
 
+    def version_at_least(self, version):
+        """Whether the cluster runs ``version`` or later, as of its last
+        refresh"""
+        return bool(self.druid_version) and not DruidDatasource.version_higher(
+            version, self.druid_version)
+
+    @property
+    def http_session(self):
+        return get_http_session(self.cluster_name)
+
+    @property
+    def http_timeout(self):
+        return (
+            conf.get('DRUID_HTTP_CONNECT_TIMEOUT'),
+            conf.get('DRUID_HTTP_READ_TIMEOUT'))
+
     def get_pydruid_client(self):
-        cli = PyDruid(
+        cli = DruidClient(
             "http://{0}:{1}/".format(self.broker_host, self.broker_port),
-            self.broker_endpoint)
+            self.broker_endpoint,
+            self.http_session,
+            self.http_timeout)
         return cli
 
+    def get_json(self, endpoint):
+        res = self.http_session.get(endpoint, timeout=self.http_timeout)
+        res.raise_for_status()
+        return json.loads(res.text)
+
     def get_datasources(self):
         endpoint = (
             "http://{obj.coordinator_host}:{obj.coordinator_port}/"
             "{obj.coordinator_endpoint}/datasources"
         ).format(obj=self)
 
-        return json.loads(requests.get(endpoint).text)
+        return self.get_json(endpoint)
 
     def get_druid_version(self):
         endpoint = (
             "http://{obj.coordinator_host}:{obj.coordinator_port}/status"
         ).format(obj=self)
-        return json.loads(requests.get(endpoint).text)['version']
+        return self.get_json(endpoint)['version']
 
     def refresh_datasources(self, datasource_name=None, merge_flag=False):
         """Refresh metadata of all datasources in the cluster
         If ``datasource_name`` is specified, only that datasource is updated
         """
         self.druid_version = self.get_druid_version()
-        for datasource in self.get_datasources():
-            if datasource not in conf.get('DRUID_DATA_SOURCE_BLACKLIST', []):
-                if not datasource_name or datasource_name == datasource:
-                    DruidDatasource.sync_to_db(datasource, self, merge_flag)
+        blacklist = conf.get('DRUID_DATA_SOURCE_BLACKLIST', [])
+        names = [
+            name for name in self.get_datasources()
+            if name not in blacklist and
+            (not datasource_name or datasource_name == name)
+        ]
+        metadata = self.fetch_latest_metadata(names, merge_flag)
+        for name in names:
+            DruidDatasource.sync_to_db(name, self, merge_flag, metadata[name])
+
+    def fetch_latest_metadata(self, datasource_names, merge_flag=False):
+        """Fetches the latest segment metadata of datasources concurrently
+
+        :returns: the columns metadata of each datasource, by name
+        """
+        if not datasource_names:
+            return {}
+        druid_version = self.druid_version
+        # clients keep the state of their last query, each fetch gets its own
+        tasks = [
+            (self.get_pydruid_client(), name) for name in datasource_names]
+
+        def fetch(task):
+            client, name = task
+            return DruidDatasource.fetch_latest_metadata(
+                client, name, druid_version, merge_flag)
+
+        pool = ThreadPool(
+            min(conf.get('DRUID_METADATA_REFRESH_WORKERS'), len(tasks)))
+        try:
+            results = pool.map(fetch, tasks)
+        finally:
+            pool.terminate()
+        return dict(zip(datasource_names, results))
 
     @property
     def perm(self):
@@ -139,9 +359,8 @@ class DruidColumn(Model, BaseColumn):
         if self.dimension_spec_json:
             return json.loads(self.dimension_spec_json)
 
-    def generate_metrics(self):
-        """Generate metrics based on the column metadata"""
-        M = DruidMetric  # noqa
+    def get_metrics(self):
+        """The metrics generated from the column metadata, not persisted"""
         metrics = []
         metrics.append(DruidMetric(
             metric_name='count',
@@ -221,6 +440,12 @@ class DruidColumn(Model, BaseColumn):
                         'name': name,
                         'fieldNames': [self.column_name]})
                 ))
+        return metrics
+
+    def generate_metrics(self):
+        """Generate metrics based on the column metadata"""
+        M = DruidMetric  # noqa
+        metrics = self.get_metrics()
         session = get_session()
         new_metrics = []
         for metric in metrics:
@@ -310,6 +535,12 @@ class DruidDatasource(Model, BaseDatasource):
     query_langtage = "json"
     metric_class = DruidMetric
     cluster_class = DruidCluster
+    # granularities whose buckets don't span days, days being in DRUID_TZ
+    time_slice_granularities = (
+        '5 seconds', '30 seconds', '1 minute', '5 minutes', '1 hour',
+        '6 hour', 'one day', '1 day', 'PT5S', 'PT30S', 'PT1M', 'PT5M',
+        'PT15M', 'PT30M', 'PT1H', 'PT6H', 'P1D')
+    time_slice_tz = DRUID_TZ
 
     baselink = "druiddatasourcemodelview"
 
@@ -332,6 +563,8 @@ class DruidDatasource(Model, BaseDatasource):
         'DruidCluster', backref='datasources', foreign_keys=[cluster_name])
     offset = Column(Integer, default=0)
     cache_timeout = Column(Integer)
+    serve_stale_cache = Column(Boolean, default=False)
+    query_context = Column(Text)
     params = Column(String(1000))
     perm = Column(String(1000))
 
@@ -340,7 +573,8 @@ class DruidDatasource(Model, BaseDatasource):
 
     export_fields = (
         'datasource_name', 'is_hidden', 'description', 'default_endpoint',
-        'cluster_name', 'is_featured', 'offset', 'cache_timeout', 'params'
+        'cluster_name', 'is_featured', 'offset', 'cache_timeout',
+        'serve_stale_cache', 'params'
     )
 
     @property
@@ -469,8 +703,21 @@ class DruidDatasource(Model, BaseDatasource):
 
     def latest_metadata(self):
         """Returns segment metadata from the latest segment"""
-        client = self.cluster.get_pydruid_client()
-        results = client.time_boundary(datasource=self.datasource_name)
+        return self.fetch_latest_metadata(
+            self.cluster.get_pydruid_client(),
+            self.datasource_name,
+            self.cluster.druid_version,
+            self.merge_flag)
+
+    @classmethod
+    def fetch_latest_metadata(
+            cls, client, datasource_name, druid_version, merge_flag):
+        """Returns segment metadata from the latest segment of a datasource
+
+        Only goes through ``client`` and doesn't touch the ORM, so that
+        datasources can be fetched from different threads.
+        """
+        results = client.time_boundary(datasource=datasource_name)
         if not results:
             return
         max_time = results[0]['result']['maxTime']
@@ -481,14 +728,14 @@ class DruidDatasource(Model, BaseDatasource):
         # https://groups.google.com/forum/#!topic/druid-user/gVCqqspHqOQ
         lbound = (max_time - timedelta(days=7)).isoformat()
         rbound = max_time.isoformat()
-        if not self.version_higher(self.cluster.druid_version, '0.8.2'):
+        if not cls.version_higher(druid_version, '0.8.2'):
             rbound = (max_time - timedelta(1)).isoformat()
         segment_metadata = None
         try:
             segment_metadata = client.segment_metadata(
-                datasource=self.datasource_name,
+                datasource=datasource_name,
                 intervals=lbound + '/' + rbound,
-                merge=self.merge_flag,
+                merge=merge_flag,
                 analysisTypes=conf.get('DRUID_ANALYSIS_TYPES'))
         except Exception as e:
             logging.warning("Failed first attempt to get latest segment")
@@ -497,13 +744,13 @@ class DruidDatasource(Model, BaseDatasource):
             # if no segments in the past 7 days, look at all segments
             lbound = datetime(1901, 1, 1).isoformat()[:10]
             rbound = datetime(2050, 1, 1).isoformat()[:10]
-            if not self.version_higher(self.cluster.druid_version, '0.8.2'):
+            if not cls.version_higher(druid_version, '0.8.2'):
                 rbound = datetime.now().isoformat()[:10]
             try:
                 segment_metadata = client.segment_metadata(
-                    datasource=self.datasource_name,
+                    datasource=datasource_name,
                     intervals=lbound + '/' + rbound,
-                    merge=self.merge_flag,
+                    merge=merge_flag,
                     analysisTypes=conf.get('DRUID_ANALYSIS_TYPES'))
             except Exception as e:
                 logging.warning("Failed 2nd attempt to get latest segment")
@@ -591,8 +838,12 @@ class DruidDatasource(Model, BaseDatasource):
         session.commit()
 
     @classmethod
-    def sync_to_db(cls, name, cluster, merge):
-        """Fetches metadata for that datasource and merges the Superset db"""
+    def sync_to_db(cls, name, cluster, merge, cols=None):
+        """Fetches metadata for that datasource and merges the Superset db
+
+        :param cols: the latest segment metadata of the datasource when it
+            was already fetched, see ``DruidCluster.fetch_latest_metadata``
+        """
         logging.info("Syncing Druid datasource [{}]".format(name))
         session = get_session()
         datasource = session.query(cls).filter_by(datasource_name=name).first()
@@ -607,32 +858,44 @@ class DruidDatasource(Model, BaseDatasource):
         datasource.merge_flag = merge
         session.flush()
 
-        cols = datasource.latest_metadata()
+        if cols is None:
+            cols = datasource.latest_metadata()
         if not cols:
             logging.error("Failed at fetching the latest segment")
             return
+
+        # reconciled against the columns and metrics loaded once, the new
+        # ones being added in bulk
+        col_objs = {
+            col_obj.column_name: col_obj for col_obj in (
+                session.query(DruidColumn).filter_by(datasource_name=name))
+        }
+        metric_names = {
+            metric_name for metric_name, in (
+                session.query(DruidMetric.metric_name)
+                .filter_by(datasource_name=name))
+        }
+        new_objs = []
         for col in cols:
-            col_obj = (
-                session
-                .query(DruidColumn)
-                .filter_by(datasource_name=name, column_name=col)
-                .first()
-            )
             datatype = cols[col]['type']
+            col_obj = col_objs.get(col)
             if not col_obj:
                 col_obj = DruidColumn(datasource_name=name, column_name=col)
-                session.add(col_obj)
+                new_objs.append(col_obj)
             if datatype == "STRING":
                 col_obj.groupby = True
                 col_obj.filterable = True
             if datatype == "hyperUnique" or datatype == "thetaSketch":
                 col_obj.count_distinct = True
-            if col_obj:
-                col_obj.type = cols[col]['type']
-            session.flush()
+            col_obj.type = datatype
             col_obj.datasource = datasource
-            col_obj.generate_metrics()
-            session.flush()
+            for metric in col_obj.get_metrics():
+                if metric.metric_name not in metric_names:
+                    metric_names.add(metric.metric_name)
+                    metric.datasource_name = name
+                    new_objs.append(metric)
+        session.add_all(new_objs)
+        session.flush()
 
     @staticmethod
     def time_offset(granularity):
@@ -640,6 +903,20 @@ class DruidDatasource(Model, BaseDatasource):
             return 6 * 24 * 3600 * 1000  # 6 days
         return 0
 
+    @staticmethod
+    def parse_timestamps(timestamps, time_offset=0):
+        """Parses the ISO 8601 timestamps of Druid results at once
+
+        :param time_offset: milliseconds added to the timestamps
+        :returns: a DatetimeIndex of naive UTC timestamps
+        """
+        dttm = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True))
+        if dttm.tz is not None:
+            dttm = dttm.tz_convert(None)
+        if time_offset:
+            dttm += timedelta(milliseconds=time_offset)
+        return dttm
+
     # uses https://en.wikipedia.org/wiki/ISO_8601
     # http://druid.io/docs/0.8.0/querying/granularities.html
     # TODO: pass origin from the UI
@@ -844,6 +1121,10 @@ class DruidDatasource(Model, BaseDatasource):
             post_aggregations=post_aggs,
             intervals=from_dttm.isoformat() + '/' + to_dttm.isoformat(),
         )
+        context = self.get_query_context(
+            extras.get('druid_query_context'), extras.get('query_id'))
+        if context:
+            qry['context'] = context
 
         filters = self.get_filters(filter)
         if filters:
@@ -886,38 +1167,22 @@ class DruidDatasource(Model, BaseDatasource):
                         "direction": "descending",
                     }],
                 }
-                client.groupby(**pre_qry)
+                pre_query_dict = client.query_builder.groupby(
+                    pre_qry).query_dict
                 query_str += "// Two phase query\n// Phase 1\n"
-                query_str += json.dumps(
-                    client.query_builder.last_query.query_dict, indent=2)
+                query_str += json.dumps(pre_query_dict, indent=2)
                 query_str += "\n"
                 if phase == 1:
                     return query_str
                 query_str += (
                     "//\nPhase 2 (built based on phase one's results)\n")
-                df = client.export_pandas()
-                if df is not None and not df.empty:
-                    dims = qry['dimensions']
-                    filters = []
-                    for unused, row in df.iterrows():
-                        fields = []
-                        for dim in dims:
-                            f = Dimension(dim) == row[dim]
-                            fields.append(f)
-                        if len(fields) > 1:
-                            filt = Filter(type="and", fields=fields)
-                            filters.append(filt)
-                        elif fields:
-                            filters.append(fields[0])
-
-                    if filters:
-                        ff = Filter(type="or", fields=filters)
-                        if not orig_filters:
-                            qry['filter'] = ff
-                        else:
-                            qry['filter'] = Filter(type="and", fields=[
-                                ff,
-                                orig_filters])
+                dims = qry['dimensions']
+                rows = self.get_phase_one_rows(
+                    client, pre_qry, pre_query_dict, dims, granularity,
+                    force=extras.get('force'))
+                if rows:
+                    qry['filter'] = and_filters([
+                        orig_filters, self.get_rows_filter(dims, rows)])
                     qry['limit_spec'] = None
             if row_limit:
                 qry['limit_spec'] = {
@@ -934,14 +1199,105 @@ class DruidDatasource(Model, BaseDatasource):
             client.query_builder.last_query.query_dict, indent=2)
         return query_str
 
+    def get_phase_one_rows(
+            self, client, pre_qry, pre_query_dict, dims, granularity=None,
+            force=False):
+        """The values of ``dims`` for the series a two phase query keeps
+
+        Phase one aggregates the whole interval, so its rows don't depend on
+        the granularity of the query: they are kept in the query results
+        cache, keyed by the phase one query, for phase two to be rerun alone.
+        As for the query results cache, the intervals are truncated to the
+        ``granularity`` of the query in the key, so that windows relative to
+        now share their series until the next time bucket. With ``force``,
+        phase one is run again and its cached rows replaced.
+        """
+        # the context (query id, timeout...) doesn't change the results
+        signature = {
+            k: v for k, v in pre_query_dict.items() if k != 'context'}
+        grain = granularity if isinstance(granularity, string_types) else None
+        if signature.get('intervals'):
+            signature['intervals'] = truncate_intervals(
+                signature['intervals'], grain)
+        if (signature.get('limitSpec') or {}).get('intervals'):
+            signature['limitSpec'] = dict(
+                signature['limitSpec'], intervals=truncate_intervals(
+                    signature['limitSpec']['intervals'], grain))
+        cache_key = 'druid_phase_one_' + hashlib.md5(json.dumps(
+            [self.cluster_name, signature],
+            sort_keys=True).encode('utf-8')).hexdigest()
+        rows = query_results_cache.get(cache_key) \
+            if query_results_cache and not force else None
+        if rows is None:
+            result = client.groupby(**pre_qry).result or []
+            rows = [[row['event'].get(dim) for dim in dims] for row in result]
+            if query_results_cache:
+                query_results_cache.set(
+                    cache_key, rows,
+                    timeout=self.cache_timeout or self.cluster.cache_timeout)
+        return rows
+
+    def get_query_context(self, overrides=None, query_id=None):
+        """The context of the queries sent to Druid
+
+        The defaults of the cluster are overridden by those of the
+        datasource, then by ``overrides``, the context of the slice.
+        """
+        context = {}
+        for query_context in (self.cluster.query_context, self.query_context):
+            if query_context:
+                context.update(json.loads(query_context))
+        if overrides:
+            if isinstance(overrides, string_types):
+                overrides = json.loads(overrides)
+            context.update(overrides)
+        if query_id:
+            context['queryId'] = query_id
+        return context
+
+    def cancel_query(self, query_id):
+        """Cancels the queries running with ``query_id`` on the broker"""
+        cluster = self.cluster
+        url = "http://{0}:{1}/{2}/{3}".format(
+            cluster.broker_host, cluster.broker_port,
+            cluster.broker_endpoint.strip('/'), quote(query_id, safe=''))
+        res = cluster.http_session.delete(url, timeout=cluster.http_timeout)
+        res.raise_for_status()
+
+    def get_query_signature(self, query_obj):
+        # building the Druid query runs its first phase, the query object
+        # it derives from identifies it instead
+        return [
+            self.type, self.cluster_name, self.datasource_name, query_obj]
+
+    def is_time_sliceable(self, query_obj):
+        return (
+            query_obj['granularity'] in self.time_slice_granularities and
+            not query_obj['extras'].get('druid_time_origin'))
+
     def query(self, query_obj):
+        results = self.query_time_slice(query_obj)
+        if results.df.empty:
+            raise Exception(_("No data was returned."))
+        return results
+
+    def query_time_slice(self, query_obj):
         qry_start_dttm = datetime.now()
         client = self.cluster.get_pydruid_client()
-        query_str = self.get_query_str(client, qry_start_dttm, **query_obj)
-        df = client.export_pandas()
+        intervals = self.get_split_intervals(query_obj)
+        if intervals:
+            query_str, df = self.run_split_query(
+                client, qry_start_dttm, query_obj, intervals)
+        else:
+            query_str = self.get_query_str(
+                client, qry_start_dttm, **query_obj)
+            df = client.export_pandas()
 
         if df is None or df.size == 0:
-            raise Exception(_("No data was returned."))
+            return QueryResult(
+                df=pd.DataFrame(),
+                query=query_str,
+                duration=datetime.now() - qry_start_dttm)
         df.columns = [
             DTTM_ALIAS if c == 'timestamp' else c for c in df.columns]
 
@@ -961,22 +1317,143 @@ class DruidDatasource(Model, BaseDatasource):
         cols += [col for col in query_obj['metrics'] if col in df.columns]
         df = df[cols]
 
+        # the timestamps were parsed along with the results
         time_offset = DruidDatasource.time_offset(query_obj['granularity'])
-
-        def increment_timestamp(ts):
-            dt = utils.parse_human_datetime(ts).replace(
-                tzinfo=DRUID_TZ)
-            return dt + timedelta(milliseconds=time_offset)
         if DTTM_ALIAS in df.columns and time_offset:
-            df[DTTM_ALIAS] = df[DTTM_ALIAS].apply(increment_timestamp)
+            df[DTTM_ALIAS] += timedelta(milliseconds=time_offset)
 
         return QueryResult(
             df=df,
             query=query_str,
             duration=datetime.now() - qry_start_dttm)
 
+    @staticmethod
+    def get_split_intervals(query_obj):
+        """Splits the interval of a long query in day aligned sub-intervals
+
+        Sub-intervals span DRUID_QUERY_SPLIT_DAYS days at most. None are
+        returned for shorter intervals and for two phase queries, their
+        first phase running over the whole interval.
+        """
+        split_days = conf.get('DRUID_QUERY_SPLIT_DAYS')
+        from_dttm = query_obj['from_dttm']
+        to_dttm = query_obj['to_dttm']
+        if (
+                not split_days or
+                to_dttm - from_dttm <= timedelta(days=split_days) or
+                (query_obj.get('timeseries_limit') and query_obj['groupby'])):
+            return []
+        step = timedelta(days=split_days)
+        bounds = [from_dttm]
+        dttm = from_dttm.replace(hour=0, minute=0, second=0, microsecond=0)
+        dttm += step
+        while dttm < to_dttm:
+            bounds.append(dttm)
+            dttm += step
+        bounds.append(to_dttm)
+        bounds = [dttm.replace(tzinfo=DRUID_TZ).isoformat() for dttm in bounds]
+        return [
+            start + '/' + end for start, end in zip(bounds, bounds[1:])]
+
+    @staticmethod
+    def get_split_merge(query):
+        """How to aggregate the rows of ``query`` over sub-intervals again
+
+        :returns: the pandas aggregation of each aggregator, ``None`` when
+            the results of sub-intervals can't be merged
+        """
+        query_dict = query.query_dict
+        if (
+                query.query_type == 'topN' or
+                query_dict.get('having') or
+                query_dict.get('postAggregations')):
+            return None
+        merge = {}
+        for aggregation in query_dict.get('aggregations', []):
+            agg_type = aggregation.get('type')
+            if agg_type == 'filtered':
+                agg_type = aggregation.get('aggregator', {}).get('type')
+            if agg_type not in SPLIT_AGGREGATIONS:
+                return None
+            merge[aggregation['name']] = SPLIT_AGGREGATIONS[agg_type]
+        return merge
+
+    def run_split_query(self, client, qry_start_dttm, query_obj, intervals):
+        """Runs a query over ``intervals`` concurrently and merges the results
+
+        When no time bucket of the query spans days, each bucket falls in a
+        single sub-interval and the results are just put together. Otherwise
+        the rows of a bucket are aggregated again, which only sums, minimums
+        and maximums allow: with other aggregators such as hyperUnique or
+        quantiles, post aggregations, having filters or topN queries, the
+        query runs over the whole interval instead.
+
+        :returns: the query string and a DataFrame of the results
+        """
+        deferred = DeferredDruidClient(client.url, client.endpoint)
+        query_str = self.get_query_str(deferred, qry_start_dttm, **query_obj)
+        query = deferred.query_builder.last_query
+        merge = None
+        if not (
+                query_obj.get('is_timeseries', True) and
+                self.is_time_sliceable(query_obj)):
+            merge = self.get_split_merge(query)
+            if merge is None:
+                return query_str, results_to_df(client._post(query))
+
+        def run(interval):
+            sub_query = Query(
+                dict(query.query_dict, intervals=interval), query.query_type)
+            return results_to_df(client._post(sub_query))
+
+        pool = ThreadPool(
+            min(conf.get('DRUID_QUERY_SPLIT_FAN_OUT'), len(intervals)))
+        try:
+            dfs = pool.map(run, intervals)
+        finally:
+            pool.terminate()
+        dfs = [df for df in dfs if df is not None and not df.empty]
+        if not dfs:
+            return query_str, None
+
+        limit_spec = query.query_dict.get('limitSpec') or {}
+        limit = limit_spec.get('limit')
+        if merge is not None and limit and any(len(df) >= limit for df in dfs):
+            # truncated rows of a sub-interval would be missing from the sums
+            return query_str, results_to_df(client._post(query))
+        df = pd.concat(dfs, ignore_index=True)
+        if merge is not None:
+            if query.query_dict.get('granularity') == 'all':
+                # rows are stamped with the start of their sub-interval,
+                # the whole interval's start stamps them once merged
+                df['timestamp'] = self.parse_timestamps(
+                    [intervals[0].split('/')[0]])[0]
+            keys = [col for col in df.columns if col not in merge]
+            # rows with null dimensions would be dropped when grouping
+            nullable = [col for col in keys if df[col].dtype == object]
+            for col in nullable:
+                df[col] = df[col].fillna(_NULL_KEY)
+            df = df.groupby(keys, as_index=False, sort=False).agg(merge)
+            for col in nullable:
+                df.loc[df[col] == _NULL_KEY, col] = None
+        if limit:
+            columns = [
+                c for c in limit_spec.get('columns', [])
+                if c['dimension'] in df.columns]
+            if columns:
+                df = df.sort_values(
+                    by=[c['dimension'] for c in columns],
+                    ascending=[c['direction'] == 'ascending' for c in columns])
+            df = df.head(limit)
+        query_str = (
+            "// Split in {} intervals run concurrently\n".format(
+                len(intervals)) + query_str)
+        return query_str, df
+
     def get_filters(self, raw_filters):  # noqa
-        filters = None
+        """Compiles the filters of a query into a flat Druid filter"""
+        num_cols = self.num_cols
+        filters = []
         for flt in raw_filters:
             if not all(f in flt for f in ['col', 'op', 'val']):
                 continue
@@ -986,9 +1463,10 @@ class DruidDatasource(Model, BaseDatasource):
             cond = None
             if op in ('in', 'not in'):
                 eq = [types.replace("'", '').strip() for types in eq]
-            elif not isinstance(flt['val'], basestring):
+            elif not isinstance(flt['val'], string_types):
                 eq = eq[0] if len(eq) > 0 else ''
-            if col in self.num_cols:
+            is_num = col in num_cols
+            if is_num:
                 if op in ('in', 'not in'):
                     eq = [utils.js_string_to_num(v) for v in eq]
                 else:
@@ -998,25 +1476,63 @@ class DruidDatasource(Model, BaseDatasource):
             elif op == '!=':
                 cond = ~(Dimension(col) == eq)
             elif op in ('in', 'not in'):
-                fields = []
-                if len(eq) > 1:
-                    for s in eq:
-                        fields.append(Dimension(col) == s)
-                    cond = Filter(type="or", fields=fields)
-                elif len(eq) == 1:
-                    cond = Dimension(col) == eq[0]
-                if op == 'not in':
+                cond = self.get_in_filter(col, eq)
+                if cond and op == 'not in':
                     cond = ~cond
+            elif op in ('>', '<', '>=', '<='):
+                cond = self.get_bound_filter(col, op, eq, is_num)
             elif op == 'regex':
                 cond = Filter(type="regex", pattern=eq, dimension=col)
-            if filters:
-                filters = Filter(type="and", fields=[
-                    cond,
-                    filters
-                ])
-            else:
-                filters = cond
-        return filters
+            filters.append(cond)
+        return and_filters(filters)
+
+    def get_in_filter(self, col, values):
+        """Matches any of ``values``, natively when the cluster allows it"""
+        if not values:
+            return None
+        if len(values) == 1:
+            return Dimension(col) == values[0]
+        if self.cluster.version_at_least(IN_FILTER_VERSION):
+            return Filter(type="in", dimension=col, values=list(values))
+        return or_filters([Dimension(col) == v for v in values])
+
+    def get_bound_filter(self, col, op, eq, is_num=False):
+        """Compares a dimension to ``eq``, with a javascript filter on the
+        clusters that don't support bound filters"""
+        if self.cluster.version_at_least(BOUND_FILTER_VERSION):
+            bound = text_type(eq)
+            return Bound(
+                dimension=col,
+                lower=bound if op in ('>', '>=') else None,
+                upper=bound if op in ('<', '<=') else None,
+                lowerStrict=op == '>',
+                upperStrict=op == '<',
+                alphaNumeric=is_num)
+        value = 'parseFloat(x)' if is_num else 'x'
+        return Filter(
+            type="javascript",
+            dimension=col,
+            function="function(x) {{ return {} {} {}; }}".format(
+                value, op, json.dumps(eq)))
+
+    def get_rows_filter(self, dims, rows):
+        """Matches the rows, lists of values of ``dims``, as a compact filter
+
+        The rows sharing their leading values are matched by a single ``in``
+        filter on the last dimension, nested two levels deep at most.
+        """
+        groups = OrderedDict()
+        for row in rows:
+            # NaN, the nulls of the DataFrames, is the only value not equal
+            # to itself
+            row = [v if v == v else None for v in row]
+            groups.setdefault(tuple(row[:-1]), []).append(row[-1])
+        return or_filters([
+            and_filters(
+                [Dimension(dim) == v for dim, v in zip(dims, leading)] +
+                [self.get_in_filter(dims[-1], values)])
+            for leading, values in groups.items()
+        ])
 
     def _get_having_obj(self, col, op, eq):
         cond = None
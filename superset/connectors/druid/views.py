@@ -6,6 +6,7 @@ from flask_appbuilder.models.sqla.interface import SQLAInterface
 
 from flask_babel import lazy_gettext as _
 from flask_babel import gettext as __
+from wtforms.validators import Optional
 
 import superset
 from superset import db, utils, appbuilder, sm, security
@@ -106,6 +107,7 @@ class DruidClusterModelView(SupersetModelView, DeleteMixin):  # noqa
         'cluster_name',
         'coordinator_host', 'coordinator_port', 'coordinator_endpoint',
         'broker_host', 'broker_port', 'broker_endpoint', 'cache_timeout',
+        'serve_stale_cache', 'query_context',
     ]
     edit_columns = add_columns
     list_columns = ['cluster_name', 'metadata_last_refreshed']
@@ -117,6 +119,23 @@ class DruidClusterModelView(SupersetModelView, DeleteMixin):  # noqa
         'broker_host': _("Broker Host"),
         'broker_port': _("Broker Port"),
         'broker_endpoint': _("Broker Endpoint"),
+        'cache_timeout': _("Cache Timeout"),
+        'serve_stale_cache': _("Serve Stale Cache"),
+        'query_context': _("Query Context"),
+    }
+    description_columns = {
+        'serve_stale_cache': _(
+            "Serve cached charts past their cache timeout while they get "
+            "refreshed in the background. Requires Celery workers"),
+        'query_context': utils.markdown(
+            "A JSON object of the default "
+            "[query context](http://druid.io/docs/latest/querying/query-context.html) "
+            "of the queries sent to the cluster, as in "
+            "`{\"timeout\": 60000, \"priority\": 1, \"useCache\": true}`. "
+            "Datasources and slices can override its keys", True),
+    }
+    validators_columns = {
+        'query_context': [Optional(), validate_json],
     }
 
     def pre_add(self, cluster):
@@ -147,7 +166,8 @@ class DruidDatasourceModelView(SupersetModelView, DeleteMixin):  # noqa
     edit_columns = [
         'datasource_name', 'cluster', 'description', 'owner',
         'is_featured', 'is_hidden', 'filter_select_enabled',
-        'default_endpoint', 'offset', 'cache_timeout']
+        'default_endpoint', 'offset', 'cache_timeout', 'serve_stale_cache',
+        'query_context']
     add_columns = edit_columns
     show_columns = add_columns + ['perm']
     page_size = 500
@@ -157,6 +177,15 @@ class DruidDatasourceModelView(SupersetModelView, DeleteMixin):  # noqa
         'description': Markup(
             "Supports <a href='"
             "https://daringfireball.net/projects/markdown/'>markdown</a>"),
+        'serve_stale_cache': _(
+            "Serve cached charts past their cache timeout while they get "
+            "refreshed in the background. Requires Celery workers"),
+        'query_context': _(
+            "A JSON object of query context keys overriding those of the "
+            "cluster for this datasource"),
+    }
+    validators_columns = {
+        'query_context': [Optional(), validate_json],
     }
     base_filters = [['id', DatasourceFilter, lambda: []]]
     label_columns = {
@@ -170,6 +199,8 @@ class DruidDatasourceModelView(SupersetModelView, DeleteMixin):  # noqa
         'default_endpoint': _("Default Endpoint"),
         'offset': _("Time Offset"),
         'cache_timeout': _("Cache Timeout"),
+        'serve_stale_cache': _("Serve Stale Cache"),
+        'query_context': _("Query Context"),
     }
 
     def pre_add(self, datasource):
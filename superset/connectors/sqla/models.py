@@ -62,11 +62,12 @@ class TableColumn(Model, BaseColumn):
             col = literal_column(self.expression).label(name)
         return col
 
-    def get_time_filter(self, start_dttm, end_dttm):
+    def get_time_filter(self, start_dttm, end_dttm, end_inclusive=True):
         col = self.sqla_col.label('__time')
+        end = text(self.dttm_sql_literal(end_dttm))
         return and_(
             col >= text(self.dttm_sql_literal(start_dttm)),
-            col <= text(self.dttm_sql_literal(end_dttm)),
+            col <= end if end_inclusive else col < end,
         )
 
     def get_timestamp_expression(self, time_grain):
@@ -162,6 +163,10 @@ class SqlaTable(Model, BaseDatasource):
     type = "table"
     query_language = 'sql'
     metric_class = SqlMetric
+    # time grains whose buckets don't span days
+    time_slice_grains = (
+        '', 'Time Column', 'second', 'minute', '5 minute', 'half hour',
+        'hour', 'day')
 
     __tablename__ = 'tables'
     id = Column(Integer, primary_key=True)
@@ -180,6 +185,7 @@ class SqlaTable(Model, BaseDatasource):
         foreign_keys=[database_id])
     offset = Column(Integer, default=0)
     cache_timeout = Column(Integer)
+    serve_stale_cache = Column(Boolean, default=False)
     schema = Column(String(255))
     sql = Column(Text)
     params = Column(Text)
@@ -190,8 +196,8 @@ class SqlaTable(Model, BaseDatasource):
     metric_cls = SqlMetric
     export_fields = (
         'table_name', 'main_dttm_col', 'description', 'default_endpoint',
-        'database_id', 'is_featured', 'offset', 'cache_timeout', 'schema',
-        'sql', 'params')
+        'database_id', 'is_featured', 'offset', 'cache_timeout',
+        'serve_stale_cache', 'schema', 'sql', 'params')
 
     __table_args__ = (
         sa.UniqueConstraint(
@@ -419,7 +425,9 @@ class SqlaTable(Model, BaseDatasource):
                 select_exprs += [timestamp]
                 groupby_exprs += [timestamp]
 
-            time_filter = dttm_col.get_time_filter(from_dttm, to_dttm)
+            time_filter = dttm_col.get_time_filter(
+                from_dttm, to_dttm,
+                end_inclusive=not extras.get('to_dttm_exclusive'))
 
         select_exprs += metrics_exprs
         qry = sa.select(select_exprs)
@@ -511,6 +519,22 @@ class SqlaTable(Model, BaseDatasource):
         sql = sqlparse.format(sql, reindent=True)
         return sql
 
+    def get_query_signature(self, query_obj):
+        # the query object identifies the query along with the table it runs
+        # against, so that its SQL is only compiled to be run
+        return [
+            self.type, self.database.id, self.schema, self.table_name,
+            self.sql, query_obj]
+
+    def is_time_sliceable(self, query_obj):
+        time_grain = query_obj['extras'].get('time_grain_sqla') or ''
+        dttm_col = self.get_col(query_obj['granularity'])
+        if not dttm_col or time_grain not in self.time_slice_grains:
+            return False
+        # without a grain, epoch timestamps are returned as numbers
+        return bool(time_grain) or \
+            dttm_col.python_date_format not in ('epoch_s', 'epoch_ms')
+
     def query(self, query_obj):
         qry_start_dttm = datetime.now()
         engine = self.database.get_sqla_engine()
@@ -531,6 +555,16 @@ class SqlaTable(Model, BaseDatasource):
             query=sql,
             error_message=error_message)
 
+    def query_chunks(self, query_obj, chunk_size):
+        """Iterates over the results of ``query_obj`` in DataFrames
+
+        Rows are fetched ``chunk_size`` at a time through a server side
+        cursor, where the driver supports it.
+        """
+        engine = self.database.get_sqla_engine()
+        sql = self.get_query_str(engine, datetime.now(), **query_obj)
+        return self.database.get_df_chunks(sql, None, chunk_size)
+
     def get_sqla_table_object(self):
         return self.database.get_table(self.table_name, schema=self.schema)
 
@@ -132,7 +132,8 @@ class TableModelView(SupersetModelView, DeleteMixin):  # noqa
         'table_name', 'sql', 'is_featured', 'filter_select_enabled',
         'database', 'schema',
         'description', 'owner',
-        'main_dttm_col', 'default_endpoint', 'offset', 'cache_timeout']
+        'main_dttm_col', 'default_endpoint', 'offset', 'cache_timeout',
+        'serve_stale_cache']
     show_columns = edit_columns + ['perm']
     related_views = [TableColumnInlineView, SqlMetricInlineView]
     base_order = ('changed_on', 'desc')
@@ -150,6 +151,9 @@ class TableModelView(SupersetModelView, DeleteMixin):  # noqa
             "This fields acts a Superset view, meaning that Superset will "
             "run a query against this string as a subquery."
         ),
+        'serve_stale_cache': _(
+            "Serve cached charts past their cache timeout while they get "
+            "refreshed in the background. Requires Celery workers"),
     }
     base_filters = [['id', DatasourceFilter, lambda: []]]
     label_columns = {
@@ -163,6 +167,7 @@ class TableModelView(SupersetModelView, DeleteMixin):  # noqa
         'default_endpoint': _("Default Endpoint"),
         'offset': _("Offset"),
         'cache_timeout': _("Cache Timeout"),
+        'serve_stale_cache': _("Serve Stale Cache"),
     }
 
     def pre_add(self, table):
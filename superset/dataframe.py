@@ -2,7 +2,6 @@
 
 TODO(bkyryliuk): add support for the conventions like: *_dim or dim_*
                  dimensions, *_ts, ts_*, ds_*, *_ds - datetime, etc.
-TODO(bkyryliuk): recognize integer encoded enums.
 
 """
 from __future__ import absolute_import
@@ -10,17 +9,69 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 
 
 INFER_COL_TYPES_THRESHOLD = 95
 INFER_COL_TYPES_SAMPLE_SIZE = 100
+# integer columns with at most that many distinct values, over at least
+# INFER_COL_TYPES_SAMPLE_SIZE rows, are considered encoded enums
+INFER_COL_TYPES_ENUM_CARDINALITY = 10
+
+
+def df_from_rows(data, column_names, type_codes=None, db_engine_spec=None):
+    """Builds a DataFrame, column by column, out of DB-API rows
+
+    Rather than going through a 2-D object array, each column is filled in
+    a numpy array of the dtype the engine spec derives from its cursor type
+    code, integers with nulls falling back to floats. Columns without such
+    a hint, or whose values don't fit it, get their dtype inferred by pandas.
+    """
+    columns = list(zip(*data)) if data else [()] * len(column_names)
+    series = OrderedDict()
+    for i, name in enumerate(column_names):
+        dtype = None
+        if db_engine_spec and type_codes:
+            dtype = db_engine_spec.get_column_dtype(type_codes[i])
+        series[name] = typed_column(columns[i], dtype)
+    return pd.DataFrame(series, columns=column_names)
+
+
+def typed_column(values, dtype=None):
+    """Typed array, or Series when inferred, of the values of a column
+
+    Nulls are NaN in numeric columns.
+    """
+    if dtype:
+        nulls = np.fromiter(
+            (v is None for v in values), dtype=bool, count=len(values))
+        if dtype == 'int64' and nulls.any():
+            dtype = 'float64'
+        try:
+            # None values convert to NaN in float arrays
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return pd.Series(list(values))
+
+
+def sample_rows(df, size=INFER_COL_TYPES_SAMPLE_SIZE):
+    """Up to ``size`` rows spread evenly over ``df``
+
+    Unlike a random sample, the same rows are picked every time, so that
+    the same results are always typed the same way.
+    """
+    step = max(1, -(-len(df.index) // size))
+    return df.iloc[::step].head(size)
 
 
 class SupersetDataFrame(object):
     def __init__(self, df):
-        self.__df = df.where((pd.notnull(df)), None)
+        self.__df = df
+        self.__columns = None
 
     @property
     def size(self):
@@ -28,22 +79,34 @@ class SupersetDataFrame(object):
 
     @property
     def data(self):
-        return self.__df.to_dict(orient='records')
+        df = self.__df
+        null_cols = [col for col in df.columns if df[col].isnull().any()]
+        if null_cols:
+            # nulls are sent as None, only copying the columns holding some
+            df = df.copy(deep=False)
+            for col in null_cols:
+                df[col] = df[col].astype(object).where(df[col].notnull(), None)
+        return df.to_dict(orient='records')
 
     @property
     def columns(self):
         """Provides metadata about columns for data visualization.
 
+        Computed once per instance. SQL Lab stores them along with the
+        results, which are served without inferring them again.
+
         :return: dict, with the fields name, type, is_date, is_dim and agg.
         """
         if self.__df.empty:
             return None
+        if self.__columns is None:
+            self.__columns = self.infer_columns()
+        return self.__columns
+
+    def infer_columns(self):
 
         columns = []
-        sample_size = min(INFER_COL_TYPES_SAMPLE_SIZE, len(self.__df.index))
-        sample = self.__df
-        if sample_size:
-            sample = self.__df.sample(sample_size)
+        sample = sample_rows(self.__df)
         for col in self.__df.dtypes.keys():
             column = {
                 'name': col,
@@ -56,8 +119,17 @@ class SupersetDataFrame(object):
                 column['agg'] = agg
 
             if column['type'] == 'object':
-                # check if encoded datetime
-                if (datetime_conversion_rate(sample[col]) >
+                # check if encoded number, then if encoded datetime. Numbers
+                # stored as strings aren't summed, as the database can't
+                # aggregate the column without casting it
+                if (numeric_conversion_rate(sample[col]) >
+                        INFER_COL_TYPES_THRESHOLD):
+                    column.update({
+                        'type': 'numeric_string',
+                        'is_dim': False,
+                        'agg': None,
+                    })
+                elif (datetime_conversion_rate(sample[col]) >
                         INFER_COL_TYPES_THRESHOLD):
                     column.update({
                         'type': 'datetime_string',
@@ -65,6 +137,8 @@ class SupersetDataFrame(object):
                         'is_dim': False,
                         'agg': None
                     })
+            elif is_enum(self.__df[col], col):
+                column['is_dim'] = True
             # 'agg' is optional attribute
             if not column['agg']:
                 column.pop('agg', None)
@@ -72,19 +146,34 @@ class SupersetDataFrame(object):
         return columns
 
 
-# It will give false positives on the numbers that are stored as strings.
-# It is hard to distinguish integer numbers and timestamps
+def conversion_rate(data_series, converted):
+    """Percentage of the non null values converted, 0 when all are null"""
+    values = data_series.notnull()
+    if not values.sum():
+        return 0
+    return 100 * (converted.notnull() & values).sum() / values.sum()
+
+
+# It will give false positives on the numbers that are stored as strings,
+# it is hard to distinguish integer numbers and timestamps, so numbers are
+# checked for first
 def datetime_conversion_rate(data_series):
-    success = 0
-    total = 0
-    for value in data_series:
-        total += 1
-        try:
-            pd.to_datetime(value)
-            success += 1
-        except Exception:
-            continue
-    return 100 * success / total
+    return conversion_rate(
+        data_series, pd.to_datetime(data_series, errors='coerce'))
+
+
+def numeric_conversion_rate(data_series):
+    return conversion_rate(
+        data_series, pd.to_numeric(data_series, errors='coerce'))
+
+
+def is_enum(data_series, column_name):
+    """Whether an integer column looks like an encoded enum"""
+    if is_id(column_name) or not np.issubdtype(data_series.dtype, np.integer):
+        return False
+    return (
+        len(data_series) >= INFER_COL_TYPES_SAMPLE_SIZE and
+        data_series.nunique() <= INFER_COL_TYPES_ENUM_CARDINALITY)
 
 
 def is_date(dtype):
@@ -17,6 +17,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import namedtuple, defaultdict
+from six import string_types
 from superset import utils
 
 import inspect
@@ -41,11 +42,40 @@ class LimitMethod(object):
     WRAP_SQL = 'wrap_sql'
 
 
+# numpy dtypes of the cursor columns typed by name, as some drivers do
+TYPE_NAME_DTYPES = {
+    'TINYINT': 'int64',
+    'SMALLINT': 'int64',
+    'INT': 'int64',
+    'INTEGER': 'int64',
+    'BIGINT': 'int64',
+    'FLOAT': 'float64',
+    'REAL': 'float64',
+    'DOUBLE': 'float64',
+}
+
+
 class BaseEngineSpec(object):
     engine = 'base'  # str as defined in sqlalchemy.engine.engine
     cursor_execute_kwargs = {}
     time_grains = tuple()
     limit_method = LimitMethod.FETCH_MANY
+    # numpy dtypes of the cursor columns, by DB-API type code. Exact
+    # decimal types are left out, their values are kept as is
+    type_code_dtypes = {}
+
+    @classmethod
+    def get_column_dtype(cls, type_code):
+        """Numpy dtype of a cursor column, ``None`` to infer it from its data"""
+        if isinstance(type_code, string_types):
+            name = type_code.upper().split('(')[0]
+            if name.endswith('_TYPE'):
+                name = name[:-len('_TYPE')]
+            return TYPE_NAME_DTYPES.get(name)
+        try:
+            return cls.type_code_dtypes.get(type_code)
+        except TypeError:
+            return None
 
     @classmethod
     def fetch_data(cls, cursor, limit):
@@ -53,6 +83,22 @@ class BaseEngineSpec(object):
             return cursor.fetchmany(limit)
         return cursor.fetchall()
 
+    @classmethod
+    def fetch_data_chunks(cls, cursor, limit, chunk_size):
+        """Iterates over the result set in lists of up to chunk_size rows"""
+        if not cursor.description:
+            return
+        if cls.limit_method != LimitMethod.FETCH_MANY:
+            limit = None
+        fetched = 0
+        while not limit or fetched < limit:
+            size = min(chunk_size, limit - fetched) if limit else chunk_size
+            data = cursor.fetchmany(size)
+            if not data:
+                return
+            fetched += len(data)
+            yield data
+
     @classmethod
     def epoch_to_dttm(cls):
         raise NotImplementedError()
@@ -156,6 +202,14 @@ class BaseEngineSpec(object):
 
 class PostgresEngineSpec(BaseEngineSpec):
     engine = 'postgresql'
+    # psycopg2 type codes are the OIDs of the types
+    type_code_dtypes = {
+        20: 'int64',  # int8
+        21: 'int64',  # int2
+        23: 'int64',  # int4
+        700: 'float64',  # float4
+        701: 'float64',  # float8
+    }
 
     time_grains = (
         Grain("Time Column", _('Time Column'), "{col}"),
@@ -211,6 +265,16 @@ class SqliteEngineSpec(BaseEngineSpec):
 
 class MySQLEngineSpec(BaseEngineSpec):
     engine = 'mysql'
+    # MySQLdb.constants.FIELD_TYPE
+    type_code_dtypes = {
+        1: 'int64',  # TINY
+        2: 'int64',  # SHORT
+        3: 'int64',  # LONG
+        4: 'float64',  # FLOAT
+        5: 'float64',  # DOUBLE
+        8: 'int64',  # LONGLONG
+        9: 'int64',  # INT24
+    }
     time_grains = (
         Grain('Time Column', _('Time Column'), '{col}'),
         Grain("second", _('second'), "DATE_ADD(DATE({col}), "
@@ -668,6 +732,7 @@ class RedshiftEngineSpec(PostgresEngineSpec):
 
 class OracleEngineSpec(PostgresEngineSpec):
     engine = 'oracle'
+    type_code_dtypes = {}
 
     time_grains = (
         Grain('Time Column', _('Time Column'), '{col}'),
@@ -696,6 +761,7 @@ class OracleEngineSpec(PostgresEngineSpec):
 
 class VerticaEngineSpec(PostgresEngineSpec):
     engine = 'vertica'
+    type_code_dtypes = {}
 
 engines = {
     o.engine: o for o in globals().values()
@@ -0,0 +1,23 @@
+"""query results pages
+
+Revision ID: 4e2a6c1b9d83
+Revises: c0a3ea245b61
+Create Date: 2017-03-24 10:41:07.118394
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4e2a6c1b9d83'
+down_revision = 'c0a3ea245b61'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column(
+        'query', sa.Column('results_pages', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('query', 'results_pages')
@@ -0,0 +1,23 @@
+"""druid version
+
+Revision ID: b3f1a2c9d4e7
+Revises: 4e2a6c1b9d83
+Create Date: 2017-03-28 16:02:45.584291
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1a2c9d4e7'
+down_revision = '4e2a6c1b9d83'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column(
+        'clusters', sa.Column('druid_version', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('clusters', 'druid_version')
@@ -0,0 +1,28 @@
+"""serve_stale_cache
+
+Revision ID: c0a3ea245b61
+Revises: b318dfe5fb6c
+Create Date: 2017-03-21 16:12:48.305861
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c0a3ea245b61'
+down_revision = 'b318dfe5fb6c'
+
+from alembic import op
+import sqlalchemy as sa
+
+TABLES = ['slices', 'tables', 'datasources', 'dbs', 'clusters']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column('serve_stale_cache', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_column(table, 'serve_stale_cache')
@@ -0,0 +1,26 @@
+"""druid query context
+
+Revision ID: d5b8e4a7f1c2
+Revises: b3f1a2c9d4e7
+Create Date: 2017-03-30 11:20:13.418754
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5b8e4a7f1c2'
+down_revision = 'b3f1a2c9d4e7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column(
+        'clusters', sa.Column('query_context', sa.Text(), nullable=True))
+    op.add_column(
+        'datasources', sa.Column('query_context', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('datasources', 'query_context')
+    op.drop_column('clusters', 'query_context')
@@ -8,9 +8,11 @@ import functools
 import json
 import logging
 import numpy
+import os
 import pickle
 import re
 import textwrap
+import threading
 from future.standard_library import install_aliases
 from copy import copy
 from datetime import datetime, date
@@ -18,6 +20,7 @@ from datetime import datetime, date
 import pandas as pd
 import sqlalchemy as sqla
 from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import NoSuchModuleError
 from sqlalchemy.orm import subqueryload
 
 from flask import escape, g, Markup, request
@@ -101,11 +104,13 @@ class Slice(Model, AuditMixinNullable, ImportMixin):
     params = Column(Text)
     description = Column(Text)
     cache_timeout = Column(Integer)
+    serve_stale_cache = Column(Boolean, default=False)
     perm = Column(String(1000))
     owners = relationship("User", secondary=slice_user)
 
     export_fields = ('slice_name', 'datasource_type', 'datasource_name',
-                     'viz_type', 'params', 'cache_timeout')
+                     'viz_type', 'params', 'cache_timeout',
+                     'serve_stale_cache')
 
     def __repr__(self):
         return self.slice_name
@@ -141,7 +146,7 @@ class Slice(Model, AuditMixinNullable, ImportMixin):
     def viz(self):
         d = json.loads(self.params)
         viz_class = viz_types[self.viz_type]
-        return viz_class(self.datasource, form_data=d)
+        return viz_class(self.datasource, form_data=d, slice_=self)
 
     @property
     def description_markeddown(self):
@@ -497,6 +502,69 @@ class Dashboard(Model, AuditMixinNullable, ImportMixin):
         })
 
 
+class EngineRegistry(object):
+
+    """Process-wide registry of pooled SQLAlchemy engines
+
+    Engines are stored per ``(database id, schema)`` along with a fingerprint
+    of the decrypted URI and the ``engine_params`` they were built with, so
+    that editing a ``Database`` row transparently swaps the engine, even in
+    processes that didn't perform the edit. Pooled connections can't be
+    shared across a fork, so the registry starts over whenever the process
+    id changes (gunicorn and Celery workers fork after import).
+    """
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._engines = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # The inherited engines own sockets of the parent process, they
+            # are dropped without being disposed to leave those untouched
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._engines = {}
+
+    def get(self, key, fingerprint, factory):
+        """Returns the engine stored under ``key``, building it if needed"""
+        self._check_pid()
+        with self._lock:
+            cached = self._engines.get(key)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+            engine = factory()
+            self._engines[key] = (fingerprint, engine)
+        if cached:
+            cached[1].dispose()
+        return engine
+
+    def invalidate(self, database_id):
+        """Disposes of all the engines built for a database"""
+        self._check_pid()
+        with self._lock:
+            keys = [k for k in self._engines if k[0] == database_id]
+            engines = [self._engines.pop(k)[1] for k in keys]
+        for engine in engines:
+            engine.dispose()
+
+    def clear(self):
+        self._check_pid()
+        with self._lock:
+            engines = [engine for _, engine in self._engines.values()]
+            self._engines = {}
+        for engine in engines:
+            engine.dispose()
+
+
+engine_registry = EngineRegistry()
+
+
+def invalidate_engines(mapper, connection, target):  # noqa
+    engine_registry.invalidate(target.id)
+
+
 class Database(Model, AuditMixinNullable):
 
     """An ORM object that stores Database related information"""
@@ -509,6 +577,7 @@ class Database(Model, AuditMixinNullable):
     sqlalchemy_uri = Column(String(1024))
     password = Column(EncryptedType(String(1024), config.get('SECRET_KEY')))
     cache_timeout = Column(Integer)
+    serve_stale_cache = Column(Boolean, default=False)
     select_as_create_table_as = Column(Boolean, default=False)
     expose_in_sqllab = Column(Boolean, default=False)
     allow_run_sync = Column(Boolean, default=True)
@@ -550,7 +619,12 @@ class Database(Model, AuditMixinNullable):
         url = make_url(self.sqlalchemy_uri_decrypted)
         params = extra.get('engine_params', {})
         url.database = self.get_database_for_various_backend(url, schema)
-        return create_engine(url, **params)
+        if not self.id or not config.get('DATABASE_ENGINE_POOLING'):
+            return create_engine(url, **params)
+        fingerprint = (str(url), json.dumps(params, sort_keys=True))
+        return engine_registry.get(
+            (self.id, schema), fingerprint,
+            lambda: create_engine(url, **params))
 
     def get_database_for_various_backend(self, uri, default_database=None):
         database = uri.database
@@ -580,7 +654,36 @@ class Database(Model, AuditMixinNullable):
         cur = eng.execute(sql, schema=schema)
         cols = [col[0] for col in cur.cursor.description]
         df = pd.DataFrame(cur.fetchall(), columns=cols)
+        return self.stringify_nested_values(df)
+
+    def get_df_chunks(self, sql, schema, chunk_size):
+        """Iterates over the results of ``sql`` in DataFrames
 
+        Rows are fetched ``chunk_size`` at a time, through a server side
+        cursor where the driver supports it, so that large result sets
+        are never fully held in memory. The first DataFrame is yielded even
+        when empty, to carry the columns.
+        """
+        sql = sql.strip().strip(';')
+        eng = self.get_sqla_engine(schema=schema).execution_options(
+            stream_results=True)
+        cur = eng.execute(sql, schema=schema)
+        try:
+            cols = [col[0] for col in cur.cursor.description]
+            data = cur.fetchmany(chunk_size)
+            yield self.stringify_nested_values(
+                pd.DataFrame(data, columns=cols))
+            while data:
+                data = cur.fetchmany(chunk_size)
+                if data:
+                    yield self.stringify_nested_values(
+                        pd.DataFrame(data, columns=cols))
+        finally:
+            cur.close()
+
+    @staticmethod
+    def stringify_nested_values(df):
+        """Dumps the lists and dicts some drivers return to JSON strings"""
         def needs_conversion(df_series):
             if df_series.empty:
                 return False
@@ -649,9 +752,25 @@ class Database(Model, AuditMixinNullable):
 
     @property
     def db_engine_spec(self):
-        engine_name = self.get_sqla_engine().name or 'base'
-        return db_engine_specs.engines.get(
+        """The engine spec matching the backend of ``sqlalchemy_uri``
+
+        This is used in hot loops while building queries, so it is resolved
+        from the parsed URL instead of a live engine, and memoized until
+        ``sqlalchemy_uri`` changes.
+        """
+        cached = getattr(self, '_db_engine_spec', None)
+        if cached and cached[0] == self.sqlalchemy_uri:
+            return cached[1]
+        url = make_url(self.sqlalchemy_uri_decrypted)
+        try:
+            # aliases such as ``postgres://`` resolve to their dialect name
+            engine_name = url.get_dialect().name
+        except NoSuchModuleError:
+            engine_name = url.get_backend_name()
+        spec = db_engine_specs.engines.get(
             engine_name, db_engine_specs.BaseEngineSpec)
+        self._db_engine_spec = (self.sqlalchemy_uri, spec)
+        return spec
 
     def grains(self):
         """Defines time granularity database-specific expressions.
@@ -713,6 +832,8 @@ class Database(Model, AuditMixinNullable):
 
 sqla.event.listen(Database, 'after_insert', set_perm)
 sqla.event.listen(Database, 'after_update', set_perm)
+sqla.event.listen(Database, 'after_update', invalidate_engines)
+sqla.event.listen(Database, 'after_delete', invalidate_engines)
 
 
 class Log(Model):
@@ -820,6 +941,8 @@ class Query(Model):
     error_message = Column(Text)
     # key used to store the results in the results backend
     results_key = Column(String(64), index=True)
+    # number of pages the results are stored in, when streamed
+    results_pages = Column(Integer)
 
     # Using Numeric in place of DateTime for sub-second precision
     # stored as seconds since epoch, allowing for milliseconds
@@ -872,6 +995,7 @@ class Query(Model):
             'user': self.user.username,
             'limit_reached': self.limit_reached,
             'resultsKey': self.results_key,
+            'resultsPages': self.results_pages,
         }
 
     @property
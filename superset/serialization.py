@@ -0,0 +1,161 @@
+"""Serialization of the entries kept in caches and in the results backend
+
+An entry is a JSON payload, optionally along with a DataFrame that gets
+packed in a columnar binary format instead of being expanded into JSON
+records. Entries are compressed with the configured compressor and start
+with a header naming their format and compressor, so that changing the
+configuration doesn't affect reading existing entries. Entries written
+before this header existed, zlib compressed JSON, are still read.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import struct
+import zlib
+
+import pandas as pd
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from superset import app, utils
+
+# zlib streams can't start with a null byte
+MAGIC = b'\x00SS'
+
+
+def _msgpack_dumps(df):
+    return df.to_msgpack()
+
+
+def _msgpack_loads(data):
+    return pd.read_msgpack(io.BytesIO(data))
+
+
+def _arrow_dumps(df):
+    table = pyarrow.Table.from_pandas(df)
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, table.schema)
+    writer.write_table(table)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def _arrow_loads(data):
+    reader = pyarrow.RecordBatchStreamReader(pyarrow.BufferReader(data))
+    return reader.read_all().to_pandas()
+
+
+def _json_dumps(df):
+    obj = {'columns': list(df.columns), 'data': df.values.tolist()}
+    return json.dumps(obj, default=utils.json_iso_dttm_ser).encode('utf-8')
+
+
+def _json_loads(data):
+    obj = json.loads(data.decode('utf-8'))
+    return pd.DataFrame(obj['data'], columns=obj['columns'])
+
+
+# DataFrame formats, ``json`` being the fallback for what others can't pack
+FORMATS = {
+    'json': (_json_dumps, _json_loads),
+    'msgpack': (_msgpack_dumps, _msgpack_loads),
+}
+if pyarrow:
+    FORMATS['arrow'] = (_arrow_dumps, _arrow_loads)
+
+COMPRESSORS = {
+    'none': (bytes, bytes),
+    'zlib': (zlib.compress, zlib.decompress),
+}
+if lz4:
+    COMPRESSORS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+if zstandard:
+    COMPRESSORS['zstd'] = (
+        lambda data: zstandard.ZstdCompressor(
+            write_content_size=True).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+
+def get_format(name):
+    if name not in FORMATS:
+        logging.warning(
+            "Serialization format {} isn't available, "
+            "using msgpack".format(name))
+        name = 'msgpack'
+    return name
+
+
+def get_compressor(name):
+    if name not in COMPRESSORS:
+        logging.warning(
+            "Compressor {} isn't available, using zlib".format(name))
+        name = 'zlib'
+    return name
+
+
+def serialize(payload, df=None, fmt=None, compressor=None):
+    """Packs a JSON ``payload`` and an optional DataFrame into a blob
+
+    :param payload: the JSON encoded payload, as text
+    :param df: a DataFrame stored in a columnar binary format
+    :param fmt: the DataFrame format, defaults to RESULTS_SERIALIZATION_FORMAT
+    :param compressor: defaults to RESULTS_COMPRESSION
+    """
+    config = app.config
+    compressor = get_compressor(
+        compressor or config.get('RESULTS_COMPRESSION'))
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    body = struct.pack('!I', len(payload)) + payload
+    if df is None:
+        fmt = 'none'
+    else:
+        fmt = get_format(fmt or config.get('RESULTS_SERIALIZATION_FORMAT'))
+        try:
+            data = FORMATS[fmt][0](df)
+        except Exception as e:
+            # object columns holding types the format can't pack
+            logging.warning(
+                "Could not serialize as {}: {}".format(
+                    fmt, utils.error_msg_from_exception(e)))
+            fmt = 'json'
+            data = _json_dumps(df)
+        body += data
+    header = MAGIC + '{}:{}:'.format(fmt, compressor).encode('utf-8')
+    return header + COMPRESSORS[compressor][0](body)
+
+
+def deserialize(blob):
+    """Unpacks a blob packed by ``serialize``
+
+    :returns: a ``(payload, df)`` tuple, ``payload`` being the JSON text and
+        ``df`` ``None`` when no DataFrame was packed
+    """
+    if not blob.startswith(MAGIC):
+        return utils.zlib_uncompress_to_string(blob), None
+    fmt, compressor, body = blob[len(MAGIC):].split(b':', 2)
+    body = COMPRESSORS[compressor.decode('utf-8')][1](body)
+    size = struct.unpack('!I', body[:4])[0]
+    payload = body[4:4 + size].decode('utf-8')
+    df = None
+    fmt = fmt.decode('utf-8')
+    if fmt != 'none':
+        df = FORMATS[fmt][1](body[4 + size:])
+    return payload, df
@@ -2,7 +2,6 @@ import celery
 from datetime import datetime
 import json
 import logging
-import numpy as np
 import pandas as pd
 import sqlalchemy
 import uuid
@@ -11,7 +10,9 @@ from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker
 
 from superset import (
-    app, db, utils, dataframe, results_backend)
+    app, cache, cache_util, db, utils, dataframe, results_backend,
+    serialization, viz)
+from superset.connectors.connector_registry import ConnectorRegistry
 from superset.models import core as models
 from superset.sql_parse import SupersetQuery
 from superset.db_engine_specs import LimitMethod
@@ -42,6 +43,106 @@ def dedup(l, suffix='__'):
     return new_l
 
 
+def get_df(cursor, data, db_engine_spec):
+    """Builds the DataFrame of rows fetched from ``cursor``"""
+    description = cursor.description or []
+    column_names = dedup([col[0] for col in description])
+    return dataframe.df_from_rows(
+        data, column_names, [col[1] for col in description], db_engine_spec)
+
+
+def results_page_key(key, page):
+    """Key of a page of the results stored under ``key``"""
+    return '{}_page_{}'.format(key, page)
+
+
+def get_results_pages(key, start, end):
+    """Yields the DataFrames of the pages ``start`` to ``end`` of ``key``"""
+    for page in range(start, end):
+        blob = results_backend.get(results_page_key(key, page))
+        if not blob:
+            raise Exception(
+                "Page {} of the results is missing".format(page))
+        yield serialization.deserialize(blob)[1]
+
+
+def concat_results_pages(key, start, end):
+    """DataFrame of the pages ``start`` to ``end`` of ``key``"""
+    dfs = list(get_results_pages(key, start, end))
+    if not dfs:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
+def get_results_slice(key, payload, offset=0, limit=None):
+    """DataFrame of ``limit`` rows from ``offset`` of paged results
+
+    Only reads the pages holding these rows.
+    """
+    page_size = payload['page_size']
+    start = offset // page_size
+    end = payload['pages']
+    if limit:
+        end = min(end, -(-(offset + limit) // page_size))
+    df = concat_results_pages(key, start, end)
+    offset -= start * page_size
+    return df.iloc[offset:(offset + limit) if limit else None]
+
+
+def store_results_payload(query, payload):
+    """Stores the payload describing the results pages of ``query``"""
+    payload = dict(
+        payload,
+        pages=query.results_pages,
+        page_size=app.config.get('SQLLAB_RESULTS_PAGE_SIZE'))
+    results_backend.set(query.results_key, serialization.serialize(
+        json.dumps(payload, default=utils.json_iso_dttm_ser)))
+
+
+def store_results_pages(query, session, cursor, db_engine_spec, page_size):
+    """Fetches the results in pages written to the results backend
+
+    Only a page of rows is held in memory at a time. The results are
+    published as soon as the first page is stored, their payload keeping
+    the running status of the query and the count of the pages stored so
+    far, which is updated as pages land. Returns the columns metadata,
+    inferred from rows sampled out of every page.
+    """
+    key = '{}'.format(uuid.uuid4())
+    logging.info("Storing results in results backend, key: {}".format(key))
+    query.results_pages = 0
+    query.rows = 0
+    samples = []
+    columns = None
+    chunks = db_engine_spec.fetch_data_chunks(cursor, query.limit, page_size)
+    for data in chunks:
+        df = get_df(cursor, data, db_engine_spec)
+        results_backend.set(
+            results_page_key(key, query.results_pages),
+            serialization.serialize('{}', df))
+        query.results_pages += 1
+        query.rows += len(df.index)
+        samples.append(dataframe.sample_rows(df))
+        if columns is None:
+            # typed off of the first page until all of them are stored
+            columns = dataframe.SupersetDataFrame(df).columns
+            query.results_key = key
+        store_results_payload(query, {
+            'query_id': query.id,
+            'status': query.status,
+            'columns': columns,
+            'query': query.to_dict(),
+        })
+        session.commit()
+    query.results_key = key
+    if not samples:
+        # typed off of the cursor only, the names making up CSV headers
+        return dataframe.SupersetDataFrame(
+            get_df(cursor, [], db_engine_spec)).infer_columns()
+    return dataframe.SupersetDataFrame(
+        pd.concat(samples, ignore_index=True)).columns
+
+
 @celery_app.task(bind=True)
 def get_sql_results(self, query_id, return_results=True, store_results=False):
     """Executes the sql query returns the results."""
@@ -118,11 +219,17 @@ def get_sql_results(self, query_id, return_results=True, store_results=False):
 
     query.status = QueryStatus.RUNNING
     session.flush()
+    page_size = app.config.get('SQLLAB_RESULTS_PAGE_SIZE')
+    stream_results = store_results and not return_results and page_size
     try:
         logging.info("Handling cursor")
         db_engine_spec.handle_cursor(cursor, query, session)
         logging.info("Fetching data: {}".format(query.to_dict()))
-        data = db_engine_spec.fetch_data(cursor, query.limit)
+        if stream_results:
+            columns = store_results_pages(
+                query, session, cursor, db_engine_spec, page_size)
+        else:
+            data = db_engine_spec.fetch_data(cursor, query.limit)
     except Exception as e:
         logging.exception(e)
         conn.close()
@@ -138,14 +245,11 @@ def get_sql_results(self, query_id, return_results=True, store_results=False):
             'query': query.to_dict(),
         }, default=utils.json_iso_dttm_ser)
 
-    column_names = (
-        [col[0] for col in cursor.description] if cursor.description else [])
-    column_names = dedup(column_names)
-    df_data = np.array(data) if data else []
-    cdf = dataframe.SupersetDataFrame(pd.DataFrame(
-        df_data, columns=column_names))
-
-    query.rows = cdf.size
+    if not stream_results:
+        df = get_df(cursor, data, db_engine_spec)
+        cdf = dataframe.SupersetDataFrame(df)
+        columns = cdf.columns
+        query.rows = cdf.size
     query.progress = 100
     query.status = QueryStatus.SUCCESS
     if query.select_as_cta:
@@ -160,20 +264,43 @@ def get_sql_results(self, query_id, return_results=True, store_results=False):
     payload = {
         'query_id': query.id,
         'status': query.status,
-        'data': cdf.data if cdf.data else [],
-        'columns': cdf.columns if cdf.columns else [],
+        'columns': columns if columns else [],
         'query': query.to_dict(),
     }
-    payload = json.dumps(payload, default=utils.json_iso_dttm_ser)
 
-    if store_results:
+    if stream_results:
+        store_results_payload(query, payload)
+    elif store_results:
         key = '{}'.format(uuid.uuid4())
         logging.info("Storing results in results backend, key: {}".format(key))
-        results_backend.set(key, utils.zlib_compress(payload))
+        # the rows are stored as a DataFrame, expanded into JSON when served
+        results_backend.set(key, serialization.serialize(
+            json.dumps(payload, default=utils.json_iso_dttm_ser), df))
         query.results_key = key
 
     session.flush()
     session.commit()
 
     if return_results:
-        return payload
+        payload['data'] = cdf.data if cdf.data else []
+        return json.dumps(payload, default=utils.json_iso_dttm_ser)
+
+
+@celery_app.task
+def refresh_viz_payload(
+        datasource_type, datasource_id, form_data, cache_key, slice_id=None,
+        lock_token=None):
+    """Recomputes a chart payload that is served stale from the cache"""
+    datasource = ConnectorRegistry.get_datasource(
+        datasource_type, datasource_id, db.session)
+    slc = None
+    if slice_id:
+        slc = db.session.query(models.Slice).filter_by(id=slice_id).first()
+    viz_obj = viz.viz_types[form_data.get('viz_type', 'table')](
+        datasource, form_data=form_data, slice_=slc)
+    try:
+        viz_obj.compute_payload(cache_key)
+    finally:
+        if lock_token:
+            cache_util.release_lock(cache, cache_key, lock_token)
+        db.session.remove()
@@ -10,16 +10,23 @@ import json
 import logging
 import numpy
 import os
+import pandas as pd
 import parsedatetime
 import pytz
 import smtplib
 import sqlalchemy as sa
 import signal
 import sys
+import threading
 import uuid
 import zlib
 
 from builtins import object
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+from contextlib import contextmanager
 from datetime import date, datetime, time
 from dateutil.parser import parse
 from email.mime.text import MIMEText
@@ -211,6 +218,39 @@ def parse_human_timedelta(s):
     return d - dttm
 
 
+def truncate_dttm(dttm, grain=None):
+    """
+    Truncates ``dttm`` to the start of its ``grain``, at most to the day
+
+    Works off the SQL time grain names as well as Druid granularities,
+    anything else truncates to the minute.
+
+    >>> dttm = datetime(2017, 3, 14, 15, 9, 26)
+    >>> truncate_dttm(dttm, 'hour')
+    datetime.datetime(2017, 3, 14, 15, 0)
+    >>> truncate_dttm(dttm, 'P1M')
+    datetime.datetime(2017, 3, 14, 0, 0)
+    >>> truncate_dttm(dttm)
+    datetime.datetime(2017, 3, 14, 15, 9)
+    """
+    grain = (grain or '').lower()
+    if grain.startswith('pt'):
+        grain = {'s': 'second', 'm': 'minute', 'h': 'hour'}.get(grain[-1:])
+    elif grain.startswith('p'):
+        grain = 'day'
+    if not grain:
+        grain = 'minute'
+    if 'second' in grain:
+        return dttm.replace(microsecond=0)
+    if 'minute' in grain or 'half' in grain:
+        return dttm.replace(second=0, microsecond=0)
+    if 'hour' in grain:
+        return dttm.replace(minute=0, second=0, microsecond=0)
+    if any(s in grain for s in ('day', 'week', 'month', 'quarter', 'year')):
+        return dttm.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dttm.replace(second=0, microsecond=0)
+
+
 class JSONEncodedDict(TypeDecorator):
 
     """Represents an immutable structure as a json-encoded string."""
@@ -440,6 +480,31 @@ def pessimistic_connection_handling(target):
         cursor.close()
 
 
+class KeyedSemaphore(object):
+
+    """Bounds the number of threads working on the same key at once
+
+    >>> limiter = KeyedSemaphore(2)
+    >>> with limiter.hold('examples'):
+    ...     pass
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if not semaphore:
+                semaphore = threading.BoundedSemaphore(self.limit)
+                self._semaphores[key] = semaphore
+        with semaphore:
+            yield
+
+
 class QueryStatus(object):
 
     """Enum-type class for query statuses"""
@@ -578,12 +643,51 @@ def choicify(values):
     return [(v, v) for v in values]
 
 
+def get_max_rss():
+    """Peak resident set size of the process, in KB on Linux, else None"""
+    if resource:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
 def setup_cache(app, cache_config):
     """Setup the flask-cache on a flask app"""
     if cache_config and cache_config.get('CACHE_TYPE') != 'null':
         return Cache(app, config=cache_config)
 
 
+def df_chunks_to_csv(chunks, compress=False, columns=None):
+    """Yields the CSV rendering of an iterable of DataFrames
+
+    The header comes from the first DataFrame, or from ``columns`` when
+    there is none, and the output is gzipped on the fly when ``compress``
+    is set.
+    """
+    compressor = None
+    if compress:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    header = True
+    for df in chunks:
+        csv = df.to_csv(index=False, header=header, encoding='utf-8')
+        header = False
+        csv = encode_csv(csv, compressor)
+        if csv:
+            yield csv
+    if header and columns:
+        csv = pd.DataFrame(columns=columns).to_csv(
+            index=False, encoding='utf-8')
+        yield encode_csv(csv, compressor)
+    if compressor:
+        yield compressor.flush()
+
+
+def encode_csv(csv, compressor=None):
+    if not isinstance(csv, bytes):
+        csv = csv.encode('utf-8')
+    if compressor:
+        csv = compressor.compress(csv)
+    return csv
+
+
 def zlib_compress(data):
     """
     compress things in a py2/3 safe fashion
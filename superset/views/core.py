@@ -6,6 +6,7 @@ from __future__ import unicode_literals
 from datetime import datetime, timedelta
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import pandas as pd
 import pickle
 import re
@@ -17,7 +18,8 @@ import functools
 import sqlalchemy as sqla
 
 from flask import (
-    g, request, redirect, flash, Response, render_template, Markup)
+    g, request, redirect, flash, Response, render_template, Markup,
+    stream_with_context)
 from flask_appbuilder import expose
 from flask_appbuilder.actions import action
 from flask_appbuilder.models.sqla.interface import SQLAInterface
@@ -32,8 +34,9 @@ from werkzeug.routing import BaseConverter
 
 from superset import (
     appbuilder, cache, db, viz, utils, app,
-    sm, sql_lab, results_backend, security,
+    sm, sql_lab, results_backend, security, serialization,
 )
+from superset.dataframe import SupersetDataFrame
 from superset.legacy import cast_form_data
 from superset.utils import has_access
 from superset.connectors.connector_registry import ConnectorRegistry
@@ -47,6 +50,8 @@ from .base import (
 
 config = app.config
 log_this = models.Log.log_this
+slice_limiter = utils.KeyedSemaphore(
+    config.get('BATCH_SLICE_DATABASE_CONCURRENCY'))
 can_access = utils.can_access
 QueryStatus = models.QueryStatus
 DAR = models.DatasourceAccessRequest
@@ -111,6 +116,57 @@ def api(f):
     return functools.update_wrapper(wraps, f)
 
 
+def run_batch_slice(
+        index, slice_id, form_data, datasource_type, datasource_id, force):
+    """Computes the payload of one slice of a batch as a line of JSON
+
+    Runs in a worker thread, in an app context of its own: the slice and
+    datasource are fetched again through the session of that thread, which
+    is removed once done.
+    """
+    with app.app_context():
+        viz_obj = None
+        status = 200
+        try:
+            datasource = ConnectorRegistry.get_datasource(
+                datasource_type, datasource_id, db.session)
+            if not datasource:
+                raise Exception(DATASOURCE_MISSING_ERR)
+            slc = None
+            if slice_id:
+                slc = (
+                    db.session.query(models.Slice)
+                        .filter_by(id=slice_id)
+                        .first()
+                )
+            viz_type = form_data.get('viz_type', 'table')
+            viz_obj = viz.viz_types[viz_type](
+                datasource, form_data=form_data, slice_=slc)
+            key = (datasource_type, datasource.database.id)
+            with slice_limiter.hold(key):
+                payload = viz_obj.get_payload(force=force)
+            if payload.get('status') == QueryStatus.FAILED:
+                status = 400
+        except utils.SupersetTimeoutException as e:
+            payload = {'error': utils.error_msg_from_exception(e)}
+            status = 503
+        except Exception as e:
+            logging.exception(e)
+            payload = {'error': utils.error_msg_from_exception(e)}
+            status = 500
+        finally:
+            db.session.remove()
+        line = {
+            'index': index,
+            'slice_id': slice_id,
+            'status_code': status,
+            'payload': payload,
+        }
+        if viz_obj:
+            return viz_obj.json_dumps(line)
+        return json.dumps(line, default=utils.json_int_dttm_ser)
+
+
 def is_owner(obj, user):
     """ Check if user is owner of the slice """
     return obj and obj.owners and user in obj.owners
@@ -203,20 +259,41 @@ def generate_download_headers(extension):
     return headers
 
 
+def csv_response(chunks, headers, mimetype='text/csv', columns=None):
+    """Streams the CSV rendering of an iterable of DataFrames
+
+    Gzipped on the fly for the clients accepting it, if CSV_EXPORT_GZIP is
+    enabled. ``columns`` make up the header when there are no DataFrames.
+    """
+    headers = dict(headers, Vary='Accept-Encoding')
+    compress = bool(
+        config.get('CSV_EXPORT_GZIP') and
+        'gzip' in request.accept_encodings)
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(
+        stream_with_context(
+            utils.df_chunks_to_csv(chunks, compress, columns)),
+        status=200,
+        headers=headers,
+        mimetype=mimetype)
+
+
 class DatabaseView(SupersetModelView, DeleteMixin):  # noqa
     datamodel = SQLAInterface(models.Database)
     list_columns = [
         'database_name', 'backend', 'allow_run_sync', 'allow_run_async',
         'allow_dml', 'creator', 'changed_on_']
     add_columns = [
-        'database_name', 'sqlalchemy_uri', 'cache_timeout', 'extra',
-        'expose_in_sqllab', 'allow_run_sync', 'allow_run_async',
-        'allow_ctas', 'allow_dml', 'force_ctas_schema']
+        'database_name', 'sqlalchemy_uri', 'cache_timeout',
+        'serve_stale_cache', 'extra', 'expose_in_sqllab', 'allow_run_sync',
+        'allow_run_async', 'allow_ctas', 'allow_dml', 'force_ctas_schema']
     search_exclude_columns = ('password',)
     edit_columns = add_columns
     show_columns = [
         'tables',
         'cache_timeout',
+        'serve_stale_cache',
         'extra',
         'database_name',
         'sqlalchemy_uri',
@@ -237,6 +314,9 @@ class DatabaseView(SupersetModelView, DeleteMixin):  # noqa
             "database-urls) "
             "for more information on how to structure your URI.", True),
         'expose_in_sqllab': _("Expose this DB in SQL Lab"),
+        'serve_stale_cache': _(
+            "Serve cached charts past their cache timeout while they get "
+            "refreshed in the background. Requires Celery workers"),
         'allow_run_sync': _(
             "Allow users to run synchronous queries, this is the default "
             "and should work well for queries that can be executed "
@@ -273,6 +353,7 @@ class DatabaseView(SupersetModelView, DeleteMixin):  # noqa
         'changed_on_': _("Last Changed"),
         'sqlalchemy_uri': _("SQLAlchemy URI"),
         'cache_timeout': _("Cache Timeout"),
+        'serve_stale_cache': _("Serve Stale Cache"),
         'extra': _("Extra"),
     }
 
@@ -358,7 +439,7 @@ class SliceModelView(SupersetModelView, DeleteMixin):  # noqa
         'slice_link', 'viz_type', 'datasource_link', 'creator', 'modified']
     edit_columns = [
         'slice_name', 'description', 'viz_type', 'owners', 'dashboards',
-        'params', 'cache_timeout']
+        'params', 'cache_timeout', 'serve_stale_cache']
     base_order = ('changed_on', 'desc')
     description_columns = {
         'description': Markup(
@@ -374,10 +455,14 @@ class SliceModelView(SupersetModelView, DeleteMixin):  # noqa
         'cache_timeout': _(
             "Duration (in seconds) of the caching timeout for this slice."
         ),
+        'serve_stale_cache': _(
+            "Serve cached charts past their cache timeout while they get "
+            "refreshed in the background. Requires Celery workers"),
     }
     base_filters = [['id', SliceFilter, lambda: []]]
     label_columns = {
         'cache_timeout': _("Cache Timeout"),
+        'serve_stale_cache': _("Serve Stale Cache"),
         'creator': _("Creator"),
         'dashboards': _("Dashboards"),
         'datasource_link': _("Datasource"),
@@ -938,9 +1023,17 @@ class Superset(BaseSupersetView):
             viz_type = form_data.get('viz_type', 'table')
             datasource = ConnectorRegistry.get_datasource(
                 datasource_type, datasource_id, db.session)
+            slc = None
+            if form_data.get('slice_id'):
+                slc = (
+                    db.session.query(models.Slice)
+                        .filter_by(id=form_data['slice_id'])
+                        .first()
+                )
             viz_obj = viz.viz_types[viz_type](
                 datasource,
                 form_data=form_data,
+                slice_=slc,
             )
             return viz_obj
 
@@ -979,10 +1072,9 @@ class Superset(BaseSupersetView):
             return json_error_response(DATASOURCE_ACCESS_ERR, status=404)
 
         if request.args.get("csv") == "true":
-            return Response(
-                viz_obj.get_csv(),
-                status=200,
-                headers=generate_download_headers("csv"),
+            return csv_response(
+                viz_obj.get_csv_chunks(),
+                generate_download_headers("csv"),
                 mimetype="application/csv")
 
         if request.args.get("query") == "true":
@@ -1010,6 +1102,9 @@ class Superset(BaseSupersetView):
         try:
             payload = viz_obj.get_payload(
                 force=request.args.get('force') == 'true')
+        except utils.SupersetTimeoutException as e:
+            return json_error_response(
+                utils.error_msg_from_exception(e), status=503)
         except Exception as e:
             logging.exception(e)
             return json_error_response(utils.error_msg_from_exception(e))
@@ -1020,6 +1115,78 @@ class Superset(BaseSupersetView):
 
         return json_success(viz_obj.json_dumps(payload), status=status)
 
+    @log_this
+    @has_access_api
+    @expose("/explore_json_batch/", methods=['GET', 'POST'])
+    def explore_json_batch(self):
+        """Computes many slices concurrently, streaming newline-delimited JSON
+
+        Takes either a ``dashboard_id`` (id or slug) or ``form_data``, a JSON
+        list of form data objects carrying their ``datasource``. Slices run
+        on a bounded thread pool, with at most
+        ``BATCH_SLICE_DATABASE_CONCURRENCY`` concurrent queries per database,
+        and each slice is written out as soon as it is done as a line of
+        JSON with its ``index`` in the request, ``slice_id``, ``status_code``
+        and the same ``payload`` ``explore_json`` would return. The form data
+        of the slices and the access to their datasources are resolved here,
+        the workers only getting plain values.
+        """
+        force = request.values.get('force') == 'true'
+        dashboard_id = request.values.get('dashboard_id')
+        jobs = []
+        try:
+            if dashboard_id:
+                qry = db.session.query(models.Dashboard)
+                if dashboard_id.isdigit():
+                    qry = qry.filter_by(id=int(dashboard_id))
+                else:
+                    qry = qry.filter_by(slug=dashboard_id)
+                for slc in qry.one().slices:
+                    jobs.append((
+                        slc.id, slc.get_viz().form_data, slc.datasource))
+            else:
+                for form_data in json.loads(
+                        request.values.get('form_data') or '[]'):
+                    datasource_id, datasource_type = (
+                        form_data['datasource'].split('__'))
+                    jobs.append((
+                        form_data.get('slice_id'), form_data,
+                        ConnectorRegistry.get_datasource(
+                            datasource_type, datasource_id, db.session)))
+        except Exception as e:
+            logging.exception(e)
+            return json_error_response(
+                utils.error_msg_from_exception(e), status=400)
+        if not jobs:
+            return json_error_response(
+                "Malformed request. dashboard_id or form_data "
+                "arguments are expected", status=400)
+
+        for slice_id, form_data, datasource in jobs:
+            if not datasource:
+                return json_error_response(DATASOURCE_MISSING_ERR, status=404)
+            if not self.datasource_access(datasource):
+                return json_error_response(DATASOURCE_ACCESS_ERR, status=404)
+
+        tasks = [
+            (i, slice_id, form_data, datasource.type, datasource.id, force)
+            for i, (slice_id, form_data, datasource) in enumerate(jobs)
+        ]
+
+        def generate():
+            pool = ThreadPool(
+                min(config.get('BATCH_SLICE_WORKERS'), len(tasks)))
+            try:
+                for line in pool.imap_unordered(
+                        lambda args: run_batch_slice(*args), tasks):
+                    yield line + '\n'
+            finally:
+                pool.terminate()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="application/x-ndjson")
+
     @expose("/import_dashboards", methods=['GET', 'POST'])
     @log_this
     def import_dashboards(self):
@@ -1932,7 +2099,12 @@ class Superset(BaseSupersetView):
     @expose("/results/<key>/")
     @log_this
     def results(self, key):
-        """Serves a key off of the results backend"""
+        """Serves a key off of the results backend
+
+        Rows are paginated with the ``offset`` and ``limit`` URL parameters,
+        the latter capped to DISPLAY_SQL_MAX_ROW, and ``columns`` takes a
+        comma separated list of the columns to return.
+        """
         if not results_backend:
             return json_error_response("Results backend isn't configured")
 
@@ -1951,11 +2123,42 @@ class Superset(BaseSupersetView):
             return json_error_response(get_datasource_access_error_msg(
                 '{}'.format(rejected_tables)))
 
-        payload = utils.(blob)
         display_limit = app.config.get('DISPLAY_SQL_MAX_ROW', None)
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', display_limit, type=int)
+        if offset < 0 or (limit is not None and limit < 0):
+            return json_error_response(
+                "The offset and limit can't be negative", status=400)
         if display_limit:
-            payload_json = json.loads(payload)
-            payload_json['data'] = payload_json['data'][:display_limit]
+            limit = min(limit, display_limit) if limit else display_limit
+        end = (offset + limit) if limit else None
+        columns = request.args.get('columns')
+        columns = columns.split(',') if columns else None
+
+        payload, df = serialization.deserialize(blob)
+        payload_json = json.loads(payload)
+        if 'pages' in payload_json:
+            # results stored in pages, only reading the requested ones
+            df = sql_lab.get_results_slice(key, payload_json, offset, limit)
+        elif df is not None:
+            df = df.iloc[offset:end]
+        if df is not None:
+            if columns:
+                df = df[[col for col in df.columns if col in columns]]
+            payload_json['data'] = SupersetDataFrame(df).data
+        else:
+            # results stored as JSON records
+            data = payload_json['data'][offset:end]
+            if columns:
+                data = [
+                    {k: v for k, v in row.items() if k in columns}
+                    for row in data]
+            payload_json['data'] = data
+        if columns:
+            payload_json['columns'] = [
+                col for col in payload_json['columns']
+                if col['name'] in columns]
+        payload_json.update(offset=offset, limit=limit)
         return json_success(
             json.dumps(payload_json, default=utils.json_iso_dttm_ser))
 
@@ -1973,6 +2176,31 @@ class Superset(BaseSupersetView):
         db.session.commit()
         return Response(201)
 
+    @has_access_api
+    @expose("/cancel_query/<datasource_type>/<datasource_id>/",
+            methods=['POST'])
+    @log_this
+    def cancel_query(self, datasource_type, datasource_id):
+        """Cancels the queries of a chart request, given its ``query_id``"""
+        query_id = request.form.get('query_id')
+        if not query_id:
+            return json_error_response("Missing query_id", status=400)
+        datasource = ConnectorRegistry.get_datasource(
+            datasource_type, datasource_id, db.session)
+        if not datasource:
+            return json_error_response(DATASOURCE_MISSING_ERR)
+        if not self.datasource_access(datasource):
+            return json_error_response(DATASOURCE_ACCESS_ERR)
+        try:
+            datasource.cancel_query(query_id)
+        except NotImplementedError:
+            return json_error_response(
+                "Queries on this datasource can't be cancelled", status=400)
+        except Exception as e:
+            logging.exception(e)
+            return json_error_response(utils.error_msg_from_exception(e))
+        return json_success(json.dumps({'query_id': query_id}))
+
     @has_access_api
     @expose("/sql_json/", methods=['POST', 'GET'])
     @log_this
@@ -2065,22 +2293,30 @@ class Superset(BaseSupersetView):
             flash(get_datasource_access_error_msg('{}'.format(rejected_tables)))
             return redirect('/')
         blob = None
+        columns = None
         if results_backend and query.results_key:
             blob = results_backend.get(query.results_key)
         if blob:
-            json_payload = utils.zlib_uncompress_to_string(blob)
+            json_payload, df = serialization.deserialize(blob)
             obj = json.loads(json_payload)
-            columns = [c['name'] for c in obj['columns']]
-            df = pd.DataFrame.from_records(obj['data'], columns=columns)
-            csv = df.to_csv(index=False, encoding='utf-8')
+            if 'pages' in obj:
+                chunks = sql_lab.get_results_pages(
+                    query.results_key, 0, obj['pages'])
+                columns = [c['name'] for c in obj['columns']]
+            else:
+                if df is None:
+                    columns = [c['name'] for c in obj['columns']]
+                    df = pd.DataFrame.from_records(
+                        obj['data'], columns=columns)
+                chunks = [df]
         else:
             sql = query.select_sql or query.executed_sql
-            df = query.database.get_df(sql, query.schema)
-            # TODO(bkyryliuk): add compression=gzip for big files.
-            csv = df.to_csv(index=False, encoding='utf-8')
-        response = Response(csv, mimetype='text/csv')
-        response.headers['Content-Disposition'] = (
-            'attachment; filename={}.csv'.format(query.name))
+            chunks = query.database.get_df_chunks(
+                sql, query.schema, config.get('CSV_EXPORT_CHUNK_SIZE'))
+        response = csv_response(chunks, {
+            'Content-Disposition':
+                'attachment; filename={}.csv'.format(query.name),
+        }, columns=columns)
         return response
 
     @has_access
@@ -11,11 +11,12 @@ from __future__ import unicode_literals
 import copy
 import hashlib
 import logging
+import time
 import traceback
 import uuid
-import zlib
 
 from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import pandas as pd
@@ -24,12 +25,14 @@ from flask import request
 from flask_babel import lazy_gettext as _
 from markdown import markdown
 import simplejson as json
-from six import string_types, PY3
+from six import get_unbound_function, string_types
 from werkzeug.datastructures import ImmutableMultiDict, MultiDict
 from werkzeug.urls import Href
 from dateutil import relativedelta as rdelta
 
-from superset import app, utils, cache
+from superset import (
+    app, cache, cache_util, query_results_cache, serialization, utils)
+from superset.models.helpers import QueryResult
 from superset.utils import DTTM_ALIAS
 
 config = app.config
@@ -44,6 +47,17 @@ class BaseViz(object):
     credits = ""
     is_timeseries = False
 
+    # form data keys that have no bearing on the payload
+    cache_ignored_keys = (
+        'csv', 'force', 'json', 'query_id', 'slice_id', 'slice_name', 'token')
+    # form data keys that are fully resolved in the base query object
+    cache_query_keys = (
+        'datasource', 'druid_query_context', 'druid_time_origin',
+        'extra_filters', 'filters',
+        'granularity', 'granularity_sqla', 'having', 'having_filters',
+        'limit', 'row_limit', 'since', 'time_grain_sqla',
+        'timeseries_limit_metric', 'until', 'where')
+
     def __init__(self, datasource, form_data, slice_=None):
         self.orig_form_data = form_data
         if not datasource:
@@ -62,6 +76,8 @@ class BaseViz(object):
 
         self.status = None
         self.error_message = None
+        self.force = self.form_data.get('force') == 'true'
+        self.profile = []
 
     def get_filter_url(self):
         """Returns the URL to retrieve column values used in the filter"""
@@ -91,6 +107,27 @@ class BaseViz(object):
             '{self.datasource.id}/'.format(**locals()))
         return href(ordered_data)
 
+    @contextmanager
+    def profile_stage(self, stage):
+        """Records the duration and memory growth of a stage, in debug mode
+
+        The stages end up in the ``profile`` of the payload, the memory
+        growth being the one of the peak resident set size of the process.
+        """
+        if not config.get('DEBUG'):
+            yield
+            return
+        start = time.time()
+        max_rss = utils.get_max_rss()
+        yield
+        entry = {
+            'stage': stage,
+            'duration_ms': round((time.time() - start) * 1000, 3),
+        }
+        if max_rss is not None:
+            entry['max_rss_growth_kb'] = utils.get_max_rss() - max_rss
+        self.profile.append(entry)
+
     def get_df(self, query_obj=None):
         """Returns a pandas dataframe based on the query object"""
         if not query_obj:
@@ -99,41 +136,256 @@ class BaseViz(object):
         self.error_msg = ""
         self.results = None
 
-        timestamp_format = None
-        if self.datasource.type == 'table':
-            dttm_col = self.datasource.get_col(query_obj['granularity'])
-            if dttm_col:
-                timestamp_format = dttm_col.python_date_format
-
         # The datasource here can be different backend but the interface is common
-        self.results = self.datasource.query(query_obj)
+        with self.profile_stage('query'):
+            self.results = self.get_query_result(query_obj)
         self.query = self.results.query
         self.status = self.results.status
         self.error_message = self.results.error_message
 
         df = self.results.df
-        # Transform the timestamp we received from database to pandas supported
-        # datetime format. If no python_date_format is specified, the pattern will
-        # be considered as the default ISO date format
-        # If the datetime format is unix, the parse will use the corresponding
-        # parsing logic.
         if df is None or df.empty:
             self.status = utils.QueryStatus.FAILED
             if not self.error_message:
                 self.error_message = "No data."
             return pd.DataFrame()
+        with self.profile_stage('process_df'):
+            return self.process_df(df, self.get_timestamp_format(query_obj))
+
+    def get_timestamp_format(self, query_obj):
+        if self.datasource.type == 'table':
+            dttm_col = self.datasource.get_col(query_obj['granularity'])
+            if dttm_col:
+                return dttm_col.python_date_format
+
+    def process_df(self, df, timestamp_format=None):
+        """Prepares a DataFrame of query results for the viz, in place"""
+        # Transform the timestamp we received from database to pandas supported
+        # datetime format. If no python_date_format is specified, the pattern will
+        # be considered as the default ISO date format
+        # If the datetime format is unix, the parse will use the corresponding
+        # parsing logic.
+        if DTTM_ALIAS in df.columns:
+            if timestamp_format in ("epoch_s", "epoch_ms"):
+                df[DTTM_ALIAS] = pd.to_datetime(df[DTTM_ALIAS], utc=False)
+            else:
+                df[DTTM_ALIAS] = pd.to_datetime(
+                    df[DTTM_ALIAS], utc=False, format=timestamp_format)
+            if self.datasource.offset:
+                df[DTTM_ALIAS] += timedelta(hours=self.datasource.offset)
+        df.replace([np.inf, -np.inf], np.nan, inplace=True)
+        df.fillna(0, inplace=True)
+        return df
+
+    def get_query_result(self, query_obj):
+        """Runs ``query_obj``, through the query results cache if enabled
+
+        Results are cached by the query the datasource runs, so that charts
+        only differing by how they process the query results share them.
+        As for the payload cache, time bounds are truncated to the grain.
+        """
+        if not query_results_cache:
+            return self.datasource.query(query_obj)
+        days = self.get_sealed_days(query_obj)
+        if days:
+            return self.get_time_sliced_result(query_obj, days)
+        try:
+            cache_key = self.get_query_results_key(query_obj)
+        except Exception as e:
+            logging.exception(e)
+            return self.datasource.query(query_obj)
+
+        results = None
+        if not self.force:
+            results = self.get_cached_query_result(cache_key)
+        if results:
+            return results
+
+        results = self.datasource.query(query_obj)
+        if (
+                results.status == utils.QueryStatus.SUCCESS and
+                results.df is not None and not results.df.empty):
+            try:
+                query_results_cache.set(
+                    cache_key,
+                    serialization.serialize(
+                        json.dumps(results.query), results.df),
+                    timeout=self.cache_timeout)
+            except Exception as e:
+                logging.warning("Could not cache key {}".format(cache_key))
+                logging.exception(e)
+                query_results_cache.delete(cache_key)
+        return results
+
+    def get_query_results_key(self, query_obj):
+        """Key of the results of ``query_obj`` in the query results cache"""
+        return 'query_' + self.hash_cache_key(
+            self.datasource.get_query_signature(
+                self.truncate_query_obj(query_obj)))
+
+    def get_cached_query_result(self, cache_key):
+        """Reads query results from the cache, ``None`` if missing"""
+        blob = query_results_cache.get(cache_key)
+        if not blob:
+            return None
+        try:
+            query, df = serialization.deserialize(blob)
+            return QueryResult(
+                df=df,
+                query=json.loads(query),
+                duration=timedelta(0))
+        except Exception as e:
+            logging.error("Error reading cache: " +
+                          utils.error_msg_from_exception(e))
+
+    def get_sealed_days(self, query_obj):
+        """Starts of the sealed days of a timeseries ``query_obj``
+
+        Empty when ``query_obj`` can't be queried one day at a time, see
+        TIME_SLICED_CACHE. Days are sealed when they ended more than
+        TIME_SLICE_SEAL_DELAY seconds ago.
+        """
+        if not (
+                config.get('TIME_SLICED_CACHE') and
+                query_obj['is_timeseries'] and
+                not (query_obj['timeseries_limit'] and query_obj['groupby']) and
+                self.datasource.is_time_sliceable(query_obj)):
+            return []
+        tz = self.datasource.time_slice_tz
+        now = datetime.now(tz).replace(tzinfo=None) if tz else datetime.now()
+        end = min(
+            query_obj['to_dttm'],
+            now - timedelta(seconds=config.get('TIME_SLICE_SEAL_DELAY')))
+        day = timedelta(days=1)
+        start = query_obj['from_dttm']
+        dttm = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        if dttm < start:
+            dttm += day
+        days = []
+        while dttm + day <= end:
+            days.append(dttm)
+            dttm += day
+        return days
+
+    @staticmethod
+    def get_slice_query_obj(query_obj, from_dttm, to_dttm, exclusive=True):
+        query_obj = dict(query_obj, from_dttm=from_dttm, to_dttm=to_dttm)
+        query_obj['extras'] = dict(
+            query_obj['extras'], to_dttm_exclusive=exclusive)
+        return query_obj
+
+    def get_slice_timestamps(self, df, query_obj):
+        """The timestamps of ``df`` as nanoseconds, to split it by day"""
+        if self.datasource.time_slice_tz:
+            dttm = pd.to_datetime(df[DTTM_ALIAS], utc=True)
         else:
+            timestamp_format = self.get_timestamp_format(query_obj)
+            if timestamp_format in ("epoch_s", "epoch_ms"):
+                timestamp_format = None
+            dttm = pd.to_datetime(
+                df[DTTM_ALIAS], utc=False, format=timestamp_format)
+        return pd.DatetimeIndex(dttm).asi8
+
+    def get_slice_bound(self, dttm):
+        tz = self.datasource.time_slice_tz
+        return pd.Timestamp(dttm.replace(tzinfo=tz) if tz else dttm).value
+
+    def get_time_sliced_result(self, query_obj, days):
+        """Runs ``query_obj`` by day, the results of sealed ``days`` cached
+
+        The partial days at both ends of the interval are queried every
+        time, along with the sealed days missing from the cache,
+        consecutive ones in a single query whose results are split by day.
+        When a query reaches the row limit, the results of its days can't
+        be told complete and the whole interval is queried instead.
+        """
+        day = timedelta(days=1)
+        from_dttm = query_obj['from_dttm']
+        to_dttm = query_obj['to_dttm']
+        row_limit = query_obj.get('row_limit')
+        cache_keys = {
+            dttm: 'query_slice_' + self.hash_cache_key(
+                self.datasource.get_query_signature(self.truncate_query_obj(
+                    self.get_slice_query_obj(query_obj, dttm, dttm + day))))
+            for dttm in days}
+
+        # results by the start of their slice
+        slices = {}
+        for dttm, cache_key in cache_keys.items():
+            blob = None if self.force else query_results_cache.get(cache_key)
+            if not blob:
+                continue
+            try:
+                query, df = serialization.deserialize(blob)
+                slices[dttm] = (json.loads(query), df)
+            except Exception as e:
+                logging.error("Error reading cache: " +
+                              utils.error_msg_from_exception(e))
+
+        # (from_dttm, to_dttm, sealed days) of the queries to run
+        ranges = []
+        if from_dttm < days[0]:
+            ranges.append((from_dttm, days[0], []))
+        for dttm in days:
+            if dttm in slices:
+                continue
+            if ranges and ranges[-1][2] and ranges[-1][1] == dttm:
+                ranges[-1] = (ranges[-1][0], dttm + day, ranges[-1][2] + [dttm])
+            else:
+                ranges.append((dttm, dttm + day, [dttm]))
+        ranges.append((days[-1] + day, to_dttm, []))
+
+        duration = timedelta(0)
+        for i, (start, end, sealed) in enumerate(ranges):
+            results = self.datasource.query_time_slice(
+                self.get_slice_query_obj(
+                    query_obj, start, end, exclusive=i < len(ranges) - 1))
+            if results.status == utils.QueryStatus.FAILED:
+                return results
+            duration += results.duration
+            df = results.df
+            if row_limit and len(df) >= row_limit:
+                return self.datasource.query(query_obj)
+            if not sealed:
+                slices[start] = (results.query, df)
+                continue
             if DTTM_ALIAS in df.columns:
-                if timestamp_format in ("epoch_s", "epoch_ms"):
-                    df[DTTM_ALIAS] = pd.to_datetime(df[DTTM_ALIAS], utc=False)
-                else:
-                    df[DTTM_ALIAS] = pd.to_datetime(
-                        df[DTTM_ALIAS], utc=False, format=timestamp_format)
-                if self.datasource.offset:
-                    df[DTTM_ALIAS] += timedelta(hours=self.datasource.offset)
-            df.replace([np.inf, -np.inf], np.nan)
-            df = df.fillna(0)
-        return df
+                timestamps = self.get_slice_timestamps(df, query_obj)
+            for dttm in sealed:
+                day_df = df
+                if DTTM_ALIAS in df.columns:
+                    day_df = df[
+                        (timestamps >= self.get_slice_bound(dttm)) &
+                        (timestamps < self.get_slice_bound(dttm + day))]
+                    day_df = day_df.reset_index(drop=True)
+                slices[dttm] = (results.query, day_df)
+                try:
+                    query_results_cache.set(
+                        cache_keys[dttm],
+                        serialization.serialize(
+                            json.dumps(results.query), day_df),
+                        timeout=config.get('TIME_SLICE_CACHE_TIMEOUT'))
+                except Exception as e:
+                    logging.warning(
+                        "Could not cache key {}".format(cache_keys[dttm]))
+                    logging.exception(e)
+                    query_results_cache.delete(cache_keys[dttm])
+
+        queries = []
+        dfs = []
+        for dttm in sorted(slices):
+            query, df = slices[dttm]
+            if query not in queries:
+                queries.append(query)
+            if not df.empty:
+                dfs.append(df)
+        df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+        if row_limit and len(df) > row_limit:
+            return self.datasource.query(query_obj)
+        return QueryResult(
+            df=df,
+            query='\n\n'.join(queries),
+            duration=duration)
 
     def get_extra_filters(self):
         extra_filters = self.form_data.get('extra_filters')
@@ -175,8 +427,13 @@ class BaseViz(object):
                 if 'having_filters' in form_data else [],
             'time_grain_sqla': form_data.get("time_grain_sqla", ''),
             'druid_time_origin': form_data.get("druid_time_origin", ''),
+            'druid_query_context': form_data.get("druid_query_context"),
+            # identifies the queries of the request, to cancel them
+            'query_id': form_data.get("query_id"),
+            # bypasses the caches of the datasource as well
+            'force': self.force,
         }
-        filters = form_data['filters'] if 'filters' in form_data \
+        filters = list(form_data['filters']) if 'filters' in form_data \
                 else []
         for col, vals in self.get_extra_filters().items():
             if not (col and vals):
@@ -217,6 +474,19 @@ class BaseViz(object):
             return self.datasource.database.cache_timeout
         return config.get("CACHE_DEFAULT_TIMEOUT")
 
+    @property
+    def serve_stale_cache(self):
+        """Whether expired payloads are served while being refreshed"""
+        if self.slice and self.slice.serve_stale_cache:
+            return True
+        if getattr(self.datasource, 'serve_stale_cache', None):
+            return True
+        if (
+                hasattr(self.datasource, 'database') and
+                self.datasource.database.serve_stale_cache):
+            return True
+        return bool(config.get('CACHE_SERVE_STALE'))
+
     def get_json(self, force=False):
         return json.dumps(
             self.get_payload(force),
@@ -224,76 +494,226 @@ class BaseViz(object):
 
     @property
     def cache_key(self):
-        s = str([(k, self.form_data[k]) for k in sorted(self.form_data.keys())])
+        """Identifies the payload by the query it runs and its options
+
+        The query part comes from the resolved ``query_obj``, with its time
+        bounds truncated to the time grain, so that charts running the same
+        query share their cache entries whatever their relative time
+        expressions or UI-only fields. The remaining form data, which
+        shapes the payload out of the query results, is hashed separately.
+        """
+        try:
+            query_obj = self.query_obj()
+        except Exception:
+            # the query is bound to fail, the error surfaces when it runs
+            return self.hash_cache_key(['form_data', self.form_data])
+
+        query_obj = self.truncate_query_obj(query_obj)
+        options = {
+            k: v for k, v in self.form_data.items()
+            if k not in self.cache_ignored_keys + self.cache_query_keys}
+        options['viz_type'] = self.viz_type
+        return '{}_{}'.format(
+            self.hash_cache_key([self.datasource.type, self.datasource.id,
+                                 query_obj]),
+            self.hash_cache_key(options))
+
+    def truncate_query_obj(self, query_obj):
+        """Copy of ``query_obj`` with its time bounds truncated to the grain
+
+        The query id and the force flag of the request are left out as well.
+        """
+        query_obj = dict(query_obj)
+        query_obj['extras'] = dict(query_obj['extras'])
+        query_obj['extras'].pop('query_id', None)
+        query_obj['extras'].pop('force', None)
+        if self.datasource.type == 'table':
+            grain = query_obj['extras'].get('time_grain_sqla')
+        else:
+            grain = query_obj['granularity']
+        for k in ('from_dttm', 'to_dttm'):
+            if query_obj.get(k):
+                query_obj[k] = utils.truncate_dttm(query_obj[k], grain)
+        return query_obj
+
+    @staticmethod
+    def hash_cache_key(obj):
+        s = json.dumps(obj, sort_keys=True, default=utils.json_iso_dttm_ser)
         return hashlib.md5(s.encode('utf-8')).hexdigest()
 
+    def get_cached_payload(self, cache_key):
+        """Reads and decodes a payload from the cache, ``None`` if missing"""
+        payload = cache.get(cache_key)
+        if not payload:
+            return None
+        try:
+            cached_data, _ = serialization.deserialize(payload)
+            return json.loads(cached_data)
+        except Exception as e:
+            logging.error("Error reading cache: " +
+                          utils.error_msg_from_exception(e))
+
+    def wait_for_payload(self, cache_key):
+        """Coalesces concurrent cache misses on ``cache_key``
+
+        Only the worker holding the lock for a key computes its payload,
+        the others poll the cache until it shows up. Returns a
+        ``(payload, lock_token)`` tuple: ``payload`` is set when another
+        worker cached it in the meantime, ``lock_token`` when this worker
+        is the one expected to compute it. Both are ``None`` when the lock
+        can't be taken, the cache backend failing.
+
+        Waiting lasts up to CACHE_LOCK_WAIT seconds, past which the payload
+        is told to be still computing rather than computed once more.
+        """
+        lock_timeout = config.get('CACHE_LOCK_TIMEOUT')
+        deadline = time.time() + config.get('CACHE_LOCK_WAIT')
+        while True:
+            try:
+                token = cache_util.acquire_lock(
+                    cache, cache_key, timeout=lock_timeout)
+            except Exception as e:
+                logging.warning("Could not lock key {}".format(cache_key))
+                logging.exception(e)
+                return None, None
+            if token:
+                # the previous holder may have cached it before releasing
+                payload = self.get_cached_payload(cache_key)
+                if payload:
+                    cache_util.release_lock(cache, cache_key, token)
+                    return payload, None
+                return None, token
+            if time.time() > deadline:
+                logging.warning(
+                    "Timed out waiting for key {}".format(cache_key))
+                raise utils.SupersetTimeoutException(
+                    "The chart is still being computed, "
+                    "try again in a moment")
+            time.sleep(0.1)
+            payload = self.get_cached_payload(cache_key)
+            if payload:
+                return payload, None
+
+    @staticmethod
+    def is_stale(payload):
+        """Whether a cached payload outlived its ``cache_timeout``"""
+        if not payload.get('cache_timeout'):
+            return False
+        cached_dttm = datetime.strptime(
+            payload['cached_dttm'], '%Y-%m-%dT%H:%M:%S')
+        expiry = cached_dttm + timedelta(seconds=payload['cache_timeout'])
+        return expiry < datetime.now()
+
+    def refresh_in_background(self, cache_key):
+        """Makes sure a stale payload is being refreshed by a Celery worker
+
+        Returns ``False`` when the stale payload shouldn't be served, and
+        the payload should be computed right away instead.
+        """
+        if not self.serve_stale_cache or not config.get('CELERY_CONFIG'):
+            return False
+        try:
+            lock_token = cache_util.acquire_lock(
+                cache, cache_key, timeout=config.get('CACHE_LOCK_TIMEOUT'))
+            if lock_token:
+                # avoiding a circular import, sql_lab hosts the celery app
+                from superset import sql_lab
+                sql_lab.refresh_viz_payload.delay(
+                    self.datasource.type, self.datasource.id,
+                    self.form_data, cache_key,
+                    self.slice.id if self.slice else None, lock_token)
+        except Exception as e:
+            logging.warning("Could not refresh key {}".format(cache_key))
+            logging.exception(e)
+            return False
+        return True
+
     def get_payload(self, force=False):
         """Handles caching around the json payload retrieval"""
         cache_key = self.cache_key
         payload = None
-        force = force if force else self.form_data.get('force') == 'true'
+        lock_token = None
+        stale = False
+        force = force if force else self.force
+        self.force = force
         if not force and cache:
-            payload = cache.get(cache_key)
+            payload = self.get_cached_payload(cache_key)
+            if payload and self.is_stale(payload):
+                stale = self.refresh_in_background(cache_key)
+                if not stale:
+                    payload = None
+            if not payload:
+                payload, lock_token = self.wait_for_payload(cache_key)
+            if payload:
+                # the entry may have been cached by a different chart
+                payload['form_data'] = self.form_data
+                payload['filter_endpoint'] = self.filter_endpoint
 
         if payload:
             is_cached = True
-            try:
-                cached_data = zlib.decompress(payload)
-                if PY3:
-                    cached_data = cached_data.decode('utf-8')
-                payload = json.loads(cached_data)
-            except Exception as e:
-                logging.error("Error reading cache: " +
-                              utils.error_msg_from_exception(e))
-                payload = None
             logging.info("Serving from cache")
+        else:
+            try:
+                payload = self.compute_payload(cache_key)
+            finally:
+                if lock_token:
+                    cache_util.release_lock(cache, cache_key, lock_token)
+            is_cached = False
+        payload['is_cached'] = is_cached
+        payload['stale'] = stale
+        return payload
 
-        if not payload:
+    def compute_payload(self, cache_key):
+        """Runs the query and caches the resulting payload"""
+        data = None
+        cache_timeout = self.cache_timeout
+        stacktrace = None
+        try:
+            df = self.get_df()
+            if not self.error_message:
+                with self.profile_stage('get_data'):
+                    data = self.get_data(df)
+        except Exception as e:
+            logging.exception(e)
+            if not self.error_message:
+                self.error_message = str(e)
+            self.status = utils.QueryStatus.FAILED
             data = None
-            is_cached = False
-            cache_timeout = self.cache_timeout
-            stacktrace = None
+            stacktrace = traceback.format_exc()
+        payload = {
+            'cache_key': cache_key,
+            'cache_timeout': cache_timeout,
+            'data': data,
+            'error': self.error_message,
+            'filter_endpoint': self.filter_endpoint,
+            'form_data': self.form_data,
+            'query': self.query,
+            'status': self.status,
+            'stacktrace': stacktrace,
+        }
+        payload['cached_dttm'] = datetime.now().isoformat().split('.')[0]
+        logging.info("Caching for the next {} seconds".format(
+            cache_timeout))
+        data = self.json_dumps(payload)
+        if cache and self.status != utils.QueryStatus.FAILED:
+            timeout = cache_timeout
+            if timeout and self.serve_stale_cache:
+                # kept past its expiry to be served while being refreshed
+                timeout += config.get('CACHE_STALE_TIMEOUT')
             try:
-                df = self.get_df()
-                if not self.error_message:
-                    data = self.get_data(df)
+                cache.set(
+                    cache_key,
+                    serialization.serialize(data),
+                    timeout=timeout)
             except Exception as e:
+                # cache.set call can fail if the backend is down or if
+                # the key is too large or whatever other reasons
+                logging.warning("Could not cache key {}".format(cache_key))
                 logging.exception(e)
-                if not self.error_message:
-                    self.error_message = str(e)
-                self.status = utils.QueryStatus.FAILED
-                data = None
-                stacktrace = traceback.format_exc()
-            payload = {
-                'cache_key': cache_key,
-                'cache_timeout': cache_timeout,
-                'data': data,
-                'error': self.error_message,
-                'filter_endpoint': self.filter_endpoint,
-                'form_data': self.form_data,
-                'query': self.query,
-                'status': self.status,
-                'stacktrace': stacktrace,
-            }
-            payload['cached_dttm'] = datetime.now().isoformat().split('.')[0]
-            logging.info("Caching for the next {} seconds".format(
-                cache_timeout))
-            data = self.json_dumps(payload)
-            if PY3:
-                data = bytes(data, 'utf-8')
-            if cache and self.status != utils.QueryStatus.FAILED:
-                try:
-                    cache.set(
-                        cache_key,
-                        zlib.compress(data),
-                        timeout=cache_timeout)
-                except Exception as e:
-                    # cache.set call can fail if the backend is down or if
-                    # the key is too large or whatever other reasons
-                    logging.warning("Could not cache key {}".format(cache_key))
-                    logging.exception(e)
-                    cache.delete(cache_key)
-        payload['is_cached'] = is_cached
+                cache.delete(cache_key)
+        if config.get('DEBUG'):
+            # only describes this computation, it's left out of the cache
+            payload['profile'] = self.profile
         return payload
 
     def json_dumps(self, obj):
@@ -311,10 +731,47 @@ class BaseViz(object):
         }
         return content
 
-    def get_csv(self):
-        df = self.get_df()
-        include_index = not isinstance(df.index, pd.RangeIndex)
-        return df.to_csv(index=include_index, encoding="utf-8")
+    def get_csv_chunks(self):
+        """Iterates over the DataFrames to export as CSV
+
+        Query results are streamed from the datasources supporting it, so
+        that large exports don't get held in memory, unless the viz
+        overrides ``get_df``. Results found in the query results cache are
+        exported as is. Indexes other than the default ``RangeIndex``, such
+        as those of pivoted or time indexed DataFrames, are exported as
+        columns.
+        """
+        streamable = (
+            hasattr(self.datasource, 'query_chunks') and
+            get_unbound_function(type(self).get_df) is
+            get_unbound_function(BaseViz.get_df))
+        if not streamable:
+            yield self.reset_csv_index(self.get_df())
+            return
+        query_obj = self.query_obj()
+        timestamp_format = self.get_timestamp_format(query_obj)
+        results = None
+        if query_results_cache and not self.force:
+            try:
+                results = self.get_cached_query_result(
+                    self.get_query_results_key(query_obj))
+            except Exception as e:
+                logging.exception(e)
+        if results:
+            yield self.reset_csv_index(
+                self.process_df(results.df, timestamp_format))
+            return
+        chunks = self.datasource.query_chunks(
+            query_obj, config.get('CSV_EXPORT_CHUNK_SIZE'))
+        for df in chunks:
+            yield self.reset_csv_index(self.process_df(df, timestamp_format))
+
+    @staticmethod
+    def reset_csv_index(df):
+        """Moves the index of ``df`` to its columns, unless it's a default"""
+        if df is None or isinstance(df.index, pd.RangeIndex):
+            return df
+        return df.reset_index()
 
     def get_values_for_column(self, column):
         """
@@ -849,6 +1306,27 @@ class NVD3TimeSeriesViz(NVD3Viz):
     verbose_name = _("Time Series - Line Chart")
     sort_series = False
     is_timeseries = True
+    # whether the frontend of the viz can read the compact series format
+    columnar_series = True
+
+    @property
+    def columnar(self):
+        """Whether the series share an ``x`` array instead of carrying points
+
+        The compact format, ``{'x': [...], 'series': [{'key': ..., 'y': [...]
+        }]}``, is opted into by passing ``series_format=columnar`` in the
+        form data.
+        """
+        return (
+            self.columnar_series and
+            self.form_data.get('series_format') == 'columnar')
+
+    @staticmethod
+    def index_values(index):
+        """The index as a list, timestamps as epoch milliseconds"""
+        if isinstance(index, pd.DatetimeIndex):
+            return (index.asi8 // 10 ** 6).tolist()
+        return index.tolist()
 
     def to_series(self, df, classed='', title_suffix=''):
         cols = []
@@ -860,45 +1338,49 @@ class NVD3TimeSeriesViz(NVD3Viz):
             else:
                 cols.append(col)
         df.columns = cols
-        series = df.to_dict('series')
 
+        xs = self.index_values(df.index)
+        multiple_metrics = len(self.metrics or []) > 1
+        columnar = self.columnar
         chart_data = []
-        for name in df.T.index.tolist():
-            ys = series[name]
-            if df[name].dtype.kind not in "biufc":
+        for i, (name, dtype) in enumerate(zip(cols, df.dtypes)):
+            if dtype.kind not in "biufc":
                 continue
             if isinstance(name, string_types):
                 series_title = name
             else:
                 name = ["{}".format(s) for s in name]
-                if len(self.form_data.get('metrics')) > 1:
+                if multiple_metrics:
                     series_title = ", ".join(name)
                 else:
                     series_title = ", ".join(name[1:])
             if title_suffix:
                 series_title += title_suffix
 
+            ys = df.iloc[:, i].values.tolist()
             d = {
                 "key": series_title,
                 "classed": classed,
-                "values": [
-                    {'x': ds, 'y': ys[ds] if ds in ys else None}
-                    for ds in df.index
-                ],
             }
+            if columnar:
+                d['y'] = ys
+            else:
+                d['values'] = [{'x': x, 'y': y} for x, y in zip(xs, ys)]
             chart_data.append(d)
         return chart_data
 
     def get_data(self, df):
         fd = self.form_data
-        df = df.fillna(0)
+        # get_df filled the nulls already, the stages below work in place
+        # wherever pandas allows it
         if fd.get("granularity") == "all":
             raise Exception("Pick a time granularity for your time series")
 
-        df = df.pivot_table(
-            index=DTTM_ALIAS,
-            columns=fd.get('groupby'),
-            values=fd.get('metrics'))
+        with self.profile_stage('pivot'):
+            df = df.pivot_table(
+                index=DTTM_ALIAS,
+                columns=fd.get('groupby'),
+                values=fd.get('metrics'))
 
         fm = fd.get("resample_fillmethod")
         if not fm:
@@ -906,9 +1388,10 @@ class NVD3TimeSeriesViz(NVD3Viz):
         how = fd.get("resample_how")
         rule = fd.get("resample_rule")
         if how and rule:
-            df = df.resample(rule, how=how, fill_method=fm)
-            if not fm:
-                df = df.fillna(0)
+            with self.profile_stage('resample'):
+                df = df.resample(rule, how=how, fill_method=fm)
+                if not fm:
+                    df.fillna(0, inplace=True)
 
         if self.sort_series:
             dfs = df.sum()
@@ -916,36 +1399,40 @@ class NVD3TimeSeriesViz(NVD3Viz):
             df = df[dfs.index]
 
         if fd.get("contribution"):
-            dft = df.T
-            df = (dft / dft.sum()).T
+            with self.profile_stage('contribution'):
+                df = df.div(df.sum(axis=1), axis=0)
 
         rolling_periods = fd.get("rolling_periods")
         rolling_type = fd.get("rolling_type")
 
-        if rolling_type in ('mean', 'std', 'sum') and rolling_periods:
-            if rolling_type == 'mean':
-                df = pd.rolling_mean(df, int(rolling_periods), min_periods=0)
-            elif rolling_type == 'std':
-                df = pd.rolling_std(df, int(rolling_periods), min_periods=0)
-            elif rolling_type == 'sum':
-                df = pd.rolling_sum(df, int(rolling_periods), min_periods=0)
-        elif rolling_type == 'cumsum':
-            df = df.cumsum()
+        with self.profile_stage('rolling'):
+            if rolling_type in ('mean', 'std', 'sum') and rolling_periods:
+                periods = int(rolling_periods)
+                if rolling_type == 'mean':
+                    df = pd.rolling_mean(df, periods, min_periods=0)
+                elif rolling_type == 'std':
+                    df = pd.rolling_std(df, periods, min_periods=0)
+                elif rolling_type == 'sum':
+                    df = pd.rolling_sum(df, periods, min_periods=0)
+            elif rolling_type == 'cumsum':
+                df = df.cumsum()
 
         num_period_compare = fd.get("num_period_compare")
         if num_period_compare:
-            num_period_compare = int(num_period_compare)
-            prt = fd.get('period_ratio_type')
-            if prt and prt == 'growth':
-                df = (df / df.shift(num_period_compare)) - 1
-            elif prt and prt == 'value':
-                df = df - df.shift(num_period_compare)
-            else:
-                df = df / df.shift(num_period_compare)
+            with self.profile_stage('period_compare'):
+                num_period_compare = int(num_period_compare)
+                prt = fd.get('period_ratio_type')
+                shifted = df.shift(num_period_compare)
+                if prt and prt == 'value':
+                    df -= shifted
+                else:
+                    df /= shifted
+                    if prt and prt == 'growth':
+                        df -= 1
+                df = df[num_period_compare:]
 
-            df = df[num_period_compare:]
-
-        chart_data = self.to_series(df)
+        with self.profile_stage('to_series'):
+            chart_data = self.to_series(df)
 
         time_compare = fd.get('time_compare')
         if time_compare:
@@ -962,9 +1449,18 @@ class NVD3TimeSeriesViz(NVD3Viz):
                 index=DTTM_ALIAS,
                 columns=fd.get('groupby'),
                 values=fd.get('metrics'))
+            if self.columnar:
+                # the compared series share the x array of the others
+                df2 = df2.reindex(df.index)
             chart_data += self.to_series(
                 df2, classed='superset', title_suffix="---")
             chart_data = sorted(chart_data, key=lambda x: x['key'])
+
+        if self.columnar:
+            return {
+                'x': self.index_values(df.index),
+                'series': chart_data,
+            }
         return chart_data
 
 
@@ -1455,6 +1951,7 @@ class HorizonViz(NVD3TimeSeriesViz):
 
     viz_type = "horizon"
     verbose_name = _("Horizon Charts")
+    columnar_series = False
     credits = (
         '<a href="https://www.npmjs.com/package/d3-horizon-chart">'
         'd3-horizon-chart</a>')
@@ -9,10 +9,12 @@ import os
 import subprocess
 import time
 import unittest
+from decimal import Decimal
 
 import pandas as pd
 
 from superset import app, appbuilder, cli, db, dataframe
+from superset.db_engine_specs import PostgresEngineSpec
 from superset.models import core as models
 from superset.models.helpers import QueryStatus
 from superset.security import sync_role_definitions
@@ -64,6 +66,59 @@ class UtilityFunctionTests(SupersetTestCase):
             q.as_create_table("tmp")
         )
 
+    def test_df_from_rows(self):
+        data = [(1, 1, 'a', 1.5), (2, None, None, 2.5), (3, 3, 'c', None)]
+        df = dataframe.df_from_rows(
+            data, ['id', 'num', 'name', 'ratio'], [20, 23, 25, 701],
+            PostgresEngineSpec)
+        self.assertEqual(
+            ['int64', 'float64', 'object', 'float64'],
+            [df[col].dtype.name for col in df.columns])
+        self.assertTrue(pd.isnull(df['num'][1]))
+        self.assertEqual(
+            [{'id': 2, 'num': None, 'name': None, 'ratio': 2.5}],
+            dataframe.SupersetDataFrame(df[1:2]).data)
+
+        # values not fitting the type code hint
+        df = dataframe.df_from_rows(
+            [('x',), ('y',)], ['name'], [20], PostgresEngineSpec)
+        self.assertEqual(['x', 'y'], list(df['name']))
+
+        # numeric values are kept exact
+        df = dataframe.df_from_rows(
+            [(Decimal('0.1'),), (Decimal('0.2'),)], ['amount'], [1700],
+            PostgresEngineSpec)
+        self.assertEqual([Decimal('0.1'), Decimal('0.2')], list(df['amount']))
+
+        df = dataframe.df_from_rows([], ['id'], [20], PostgresEngineSpec)
+        self.assertEqual(['id'], list(df.columns))
+        self.assertTrue(df.empty)
+
+    def test_infer_columns(self):
+        size = dataframe.INFER_COL_TYPES_SAMPLE_SIZE
+        df = pd.DataFrame({
+            'amount': ['1.5', '2', None, '3'] * size,
+            'ds': ['2017-01-01', '2017-01-02', None, 'nope'] * size,
+            'status': [1, 2, 3, 1] * size,
+            'value': range(4 * size),
+            'empty': [None] * 4 * size,
+        })
+        columns = {
+            col['name']: col
+            for col in dataframe.SupersetDataFrame(df).columns}
+        self.assertEqual('numeric_string', columns['amount']['type'])
+        self.assertFalse(columns['amount']['is_dim'])
+        self.assertNotIn('agg', columns['amount'])
+        # a third of the dates don't parse
+        self.assertEqual('object', columns['ds']['type'])
+        self.assertEqual('object', columns['empty']['type'])
+        self.assertTrue(columns['status']['is_dim'])
+        self.assertFalse(columns['value']['is_dim'])
+        self.assertEqual(
+            50, dataframe.datetime_conversion_rate(
+                pd.Series(['2017-01-01', None, 'nope'])))
+        self.assertEqual(0, dataframe.numeric_conversion_rate(df['empty']))
+
 
 class CeleryTestCase(SupersetTestCase):
     def __init__(self, *args, **kwargs):
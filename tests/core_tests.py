@@ -6,16 +6,24 @@ from __future__ import unicode_literals
 
 import csv
 import doctest
+import gzip
 import json
 import logging
 import io
 import random
 import unittest
+from datetime import datetime, timedelta
 
+import mock
+import pandas as pd
 from flask import escape
+from werkzeug.contrib.cache import SimpleCache
 
-from superset import db, utils, appbuilder, sm, jinja_context, sql_lab
+from superset import (
+    app, db, utils, appbuilder, sm, jinja_context, serialization, sql_lab,
+    viz)
 from superset.models import core as models
+from superset.cache_util import acquire_lock, lock_key
 from superset.views.core import DatabaseView
 from superset.connectors.sqla.models import SqlaTable
 
@@ -98,6 +106,318 @@ class CoreTests(SupersetTestCase):
         resp = self.get_resp(csv_endpoint)
         assert 'Jennifer,' in resp
 
+    def test_viz_csv_chunks(self):
+        slc = self.get_slice("Girls", db.session)
+        df = slc.viz.get_df()
+        with mock.patch.dict(app.config, {'CSV_EXPORT_CHUNK_SIZE': 10}):
+            chunks = list(slc.viz.get_csv_chunks())
+        self.assertEqual(-(-len(df.index) // 10), len(chunks))
+        self.assertEqual(
+            df.values.tolist(),
+            [row for chunk in chunks for row in chunk.values.tolist()])
+
+        # the results of the query are exported off of the cache
+        with mock.patch('superset.viz.query_results_cache', SimpleCache()):
+            df = slc.viz.get_df()
+            with mock.patch.object(
+                    slc.datasource, 'query_chunks',
+                    side_effect=Exception("should hit the cache")):
+                chunks = list(slc.viz.get_csv_chunks())
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(df.values.tolist(), chunks[0].values.tolist())
+
+        # the index of a pivoted DataFrame is exported as columns
+        viz_obj = slc.viz
+        pivoted = df.set_index(['name'])
+        with mock.patch.object(
+                type(viz_obj), 'get_df', lambda unused: pivoted.copy()):
+            chunks = list(viz_obj.get_csv_chunks())
+        self.assertEqual(
+            ['name'] + list(pivoted.columns), list(chunks[0].columns))
+        self.assertEqual(df.values.tolist(), chunks[0].values.tolist())
+
+    def test_explore_json_batch(self):
+        self.login(username='admin')
+        dash = db.session.query(models.Dashboard).filter_by(
+            slug="births").first()
+        # the session of the test is removed along with the request's
+        slice_ids = sorted([slc.id for slc in dash.slices])
+        resp = self.get_resp(
+            '/superset/explore_json_batch/?dashboard_id={}'.format(dash.id))
+        lines = [json.loads(l) for l in resp.splitlines()]
+        self.assertEqual(slice_ids, sorted([l['slice_id'] for l in lines]))
+        self.assertEqual(
+            list(range(len(slice_ids))), sorted([l['index'] for l in lines]))
+
+        slc = self.get_slice("Girls", db.session)
+        resp = self.get_resp(
+            '/superset/explore_json_batch/?form_data={}'.format(
+                json.dumps([slc.viz.form_data])))
+        line = json.loads(resp)
+        self.assertEqual(200, line['status_code'])
+        assert '"Jennifer"' in resp
+
+    def test_viz_payload_is_stale(self):
+        is_stale = viz.BaseViz.is_stale
+        now = datetime.now()
+        payload = {
+            'cache_timeout': 60,
+            'cached_dttm': now.isoformat().split('.')[0],
+        }
+        self.assertFalse(is_stale(payload))
+        payload['cached_dttm'] = (
+            now - timedelta(seconds=120)).isoformat().split('.')[0]
+        self.assertTrue(is_stale(payload))
+        payload['cache_timeout'] = None
+        self.assertFalse(is_stale(payload))
+
+        slc = self.get_slice("Girls", db.session)
+        viz_obj = slc.viz
+        try:
+            # the flags of other tests mustn't leak in
+            viz_obj.datasource.serve_stale_cache = False
+            viz_obj.datasource.database.serve_stale_cache = False
+            with mock.patch.dict(app.config, {'CACHE_SERVE_STALE': False}):
+                self.assertFalse(viz_obj.serve_stale_cache)
+                slc.serve_stale_cache = True
+                self.assertTrue(viz_obj.serve_stale_cache)
+        finally:
+            slc.serve_stale_cache = False
+            db.session.rollback()
+
+    def test_viz_stale_payload(self):
+        slc = self.get_slice("Girls", db.session)
+        cache = SimpleCache()
+        viz_obj = slc.viz
+        cache_key = viz_obj.cache_key
+        cached_dttm = datetime.now() - timedelta(seconds=120)
+        cached = {
+            'data': 'stale',
+            'form_data': {},
+            'cache_timeout': 60,
+            'cached_dttm': cached_dttm.isoformat().split('.')[0],
+        }
+        cache.set(cache_key, serialization.serialize(json.dumps(cached)))
+        try:
+            slc.serve_stale_cache = True
+            with mock.patch('superset.viz.cache', cache), \
+                    mock.patch.object(viz_obj, 'compute_payload') as compute, \
+                    mock.patch(
+                        'superset.sql_lab.refresh_viz_payload.delay') as delay:
+                payload = viz_obj.get_payload()
+            self.assertEqual('stale', payload['data'])
+            self.assertTrue(payload['stale'])
+            self.assertTrue(payload['is_cached'])
+            self.assertFalse(compute.called)
+            self.assertEqual(1, delay.call_count)
+            self.assertEqual(cache_key, delay.call_args[0][3])
+            self.assertEqual(slc.id, delay.call_args[0][4])
+        finally:
+            slc.serve_stale_cache = False
+            db.session.rollback()
+
+    def test_viz_cache_key(self):
+        slc = self.get_slice("Girls", db.session)
+        form_data = dict(slc.viz.form_data)
+        cache_key = slc.viz.cache_key
+        query_key, options_key = cache_key.split('_')
+
+        form_data.update(
+            slice_name='Other name', force='true', query_id='superset_1')
+        viz_obj = viz.viz_types[form_data['viz_type']](
+            slc.datasource, form_data=form_data)
+        self.assertEqual(cache_key, viz_obj.cache_key)
+
+        form_data['groupby'] = ['gender']
+        viz_obj = viz.viz_types[form_data['viz_type']](
+            slc.datasource, form_data=form_data)
+        self.assertNotEqual(query_key, viz_obj.cache_key.split('_')[0])
+
+    def test_query_results_cache(self):
+        slc = self.get_slice("Girls", db.session)
+        with mock.patch('superset.viz.query_results_cache', SimpleCache()):
+            df = slc.viz.get_df()
+            with mock.patch.object(
+                    slc.datasource, 'query',
+                    side_effect=Exception("should hit the cache")):
+                # different post-processing options, same query
+                form_data = dict(slc.viz.form_data, viz_type='pie')
+                viz_obj = viz.viz_types['pie'](
+                    slc.datasource, form_data=form_data)
+                self.assertEqual(
+                    df.values.tolist(), viz_obj.get_df().values.tolist())
+
+    def test_compile_query_once(self):
+        slc = self.get_slice("Girls", db.session)
+        viz_obj = slc.viz
+        query_obj = viz_obj.query_obj()
+        datasource = viz_obj.datasource
+        with mock.patch('superset.viz.query_results_cache', SimpleCache()), \
+                mock.patch.object(
+                    datasource, 'get_query_str',
+                    wraps=datasource.get_query_str) as get_query_str:
+            # identifying the query doesn't compile it
+            key = viz_obj.get_query_results_key(query_obj)
+            self.assertFalse(get_query_str.called)
+            viz_obj.get_query_result(query_obj)
+            self.assertEqual(1, get_query_str.call_count)
+            viz_obj.get_query_result(query_obj)
+            self.assertEqual(1, get_query_str.call_count)
+
+            query_obj['row_limit'] = 10
+            self.assertNotEqual(key, viz_obj.get_query_results_key(query_obj))
+
+    def test_time_sliced_cache(self):
+        slc = self.get_slice("Girls", db.session)
+        form_data = {
+            'viz_type': 'line',
+            'granularity_sqla': 'ds',
+            'time_grain_sqla': 'day',
+            'metrics': ['sum__num'],
+            'groupby': ['gender'],
+            'since': '2001-12-30',
+            'until': '2002-01-03 12:00:00',
+        }
+        viz_obj = viz.NVD3TimeSeriesViz(slc.datasource, form_data)
+        query_obj = viz_obj.query_obj()
+        expected = sorted(slc.datasource.query(query_obj).df.values.tolist())
+        self.assertEqual([], viz_obj.get_sealed_days(query_obj))
+
+        with mock.patch.dict(app.config, {'TIME_SLICED_CACHE': True}), \
+                mock.patch('superset.viz.query_results_cache', SimpleCache()):
+            self.assertEqual(
+                [datetime(2001, 12, 30) + timedelta(days=i) for i in range(4)],
+                viz_obj.get_sealed_days(query_obj))
+            df = viz_obj.get_query_result(query_obj).df
+            self.assertEqual(expected, sorted(df.values.tolist()))
+
+            with mock.patch.object(
+                    slc.datasource, 'query_time_slice',
+                    wraps=slc.datasource.query_time_slice) as query_slice:
+                df = viz_obj.get_query_result(query_obj).df
+            self.assertEqual(expected, sorted(df.values.tolist()))
+            # the sealed days come from the cache, only the last is queried
+            self.assertEqual(1, query_slice.call_count)
+            slice_obj = query_slice.call_args[0][0]
+            self.assertEqual(datetime(2002, 1, 3), slice_obj['from_dttm'])
+            self.assertFalse(slice_obj['extras']['to_dttm_exclusive'])
+
+    def test_viz_profile(self):
+        slc = self.get_slice("Girls", db.session)
+        with mock.patch.dict(app.config, {'DEBUG': False}):
+            payload = slc.viz.get_payload(force=True)
+        self.assertNotIn('profile', payload)
+
+        with mock.patch.dict(app.config, {'DEBUG': True}):
+            payload = slc.viz.get_payload(force=True)
+        stages = [entry['stage'] for entry in payload['profile']]
+        self.assertEqual(['query', 'process_df', 'get_data'], stages)
+        for entry in payload['profile']:
+            self.assertGreaterEqual(entry['duration_ms'], 0)
+
+        # cache hits don't carry the profile of the computation cached
+        cache = SimpleCache()
+        with mock.patch.dict(app.config, {'DEBUG': True}), \
+                mock.patch('superset.viz.cache', cache):
+            slc.viz.get_payload(force=True)
+            viz_obj = viz.viz_types[slc.viz_type](
+                slc.datasource, form_data=slc.viz.form_data)
+            self.assertNotIn(
+                'profile', viz_obj.get_cached_payload(viz_obj.cache_key))
+            payload = viz_obj.get_payload()
+        self.assertTrue(payload['is_cached'])
+        self.assertNotIn('profile', payload)
+
+    def test_cache_miss_coalescing(self):
+        slc = self.get_slice("Girls", db.session)
+        cache = SimpleCache()
+        viz_obj = slc.viz
+        cache_key = viz_obj.cache_key
+        cached = {'data': 'cached', 'form_data': {}}
+
+        def cache_payload(unused_seconds):
+            # another worker caches the payload while holding the lock
+            cache.set(cache_key, serialization.serialize(json.dumps(cached)))
+
+        with mock.patch('superset.viz.cache', cache), \
+                mock.patch.object(viz_obj, 'compute_payload') as compute, \
+                mock.patch('superset.viz.time.sleep', cache_payload):
+            acquire_lock(cache, cache_key, timeout=60)
+            payload = viz_obj.get_payload()
+            self.assertEqual('cached', payload['data'])
+            self.assertTrue(payload['is_cached'])
+            self.assertFalse(compute.called)
+
+            # cached between the cache miss and taking the lock
+            cache.clear()
+            with mock.patch.object(
+                    viz_obj, 'get_cached_payload',
+                    side_effect=[None, dict(cached)]):
+                payload = viz_obj.get_payload()
+            self.assertEqual('cached', payload['data'])
+            self.assertFalse(compute.called)
+            self.assertIsNone(cache.get(lock_key(cache_key)))
+
+            # the holder of the lock died, its lock expires while waiting
+            with mock.patch.dict(app.config, {
+                    'CACHE_LOCK_WAIT': 30, 'CACHE_LOCK_TIMEOUT': 60}), \
+                    mock.patch('superset.viz.time.sleep',
+                               lambda unused: cache.delete(lock_key(cache_key))):
+                cache.add(lock_key(cache_key), 'dead', timeout=60)
+                viz_obj.get_payload()
+            self.assertEqual(1, compute.call_count)
+            self.assertIsNone(cache.get(lock_key(cache_key)))
+
+            # still computing past CACHE_LOCK_WAIT, the query isn't run again
+            cache.clear()
+            with mock.patch.dict(app.config, {
+                    'CACHE_LOCK_WAIT': 0, 'CACHE_LOCK_TIMEOUT': 60}), \
+                    mock.patch('superset.viz.time.sleep'):
+                cache.add(lock_key(cache_key), 'alive', timeout=60)
+                with self.assertRaises(utils.SupersetTimeoutException):
+                    viz_obj.get_payload()
+            self.assertEqual(1, compute.call_count)
+
+    def test_time_series_to_series(self):
+        slc = self.get_slice("Girls", db.session)
+        form_data = {'viz_type': 'line', 'metrics': ['sum__num']}
+        viz_obj = viz.NVD3TimeSeriesViz(slc.datasource, form_data)
+        index = pd.DatetimeIndex(['2017-01-01', '2017-01-02'])
+        df = pd.DataFrame({
+            'boys': [1, 2],
+            'girls': [3., None],
+            'label': ['a', 'b'],
+        }, index=index, columns=['boys', 'girls', 'label'])
+        xs = [utils.datetime_to_epoch(dttm) for dttm in index]
+        self.assertEqual([
+            {
+                'key': 'boys',
+                'classed': '',
+                'values': [{'x': xs[0], 'y': 1}, {'x': xs[1], 'y': 2}],
+            },
+            {
+                'key': 'girls',
+                'classed': '',
+                'values': [{'x': xs[0], 'y': 3.}, {'x': xs[1], 'y': None}],
+            },
+        ], json.loads(viz_obj.json_dumps(viz_obj.to_series(df.copy()))))
+
+        form_data['series_format'] = 'columnar'
+        self.assertEqual([
+            {'key': 'boys', 'classed': '', 'y': [1, 2]},
+            {'key': 'girls', 'classed': '', 'y': [3., None]},
+        ], json.loads(viz_obj.json_dumps(viz_obj.to_series(df.copy()))))
+        self.assertEqual(xs, viz_obj.index_values(index))
+        # timestamps are integer epoch milliseconds
+        self.assertEqual(
+            '[1483228800000, 1483315200000]',
+            viz_obj.json_dumps(viz_obj.index_values(index)))
+
+        viz_obj = viz.NVD3TimeSeriesViz(slc.datasource, {'viz_type': 'line'})
+        self.assertEqual(
+            ['boys', 'girls'],
+            [series['key'] for series in viz_obj.to_series(df.copy())])
+
     def test_admin_only_permissions(self):
         def assert_admin_permission_in(role_name, assert_func):
             role = sm.find_role(role_name)
@@ -456,6 +776,13 @@ class CoreTests(SupersetTestCase):
             io.StringIO("first_name,last_name\nadmin, user\n"))
 
         self.assertEqual(list(expected_data), list(data))
+
+        gzip_resp = self.client.get(
+            '/superset/csv/{}'.format(client_id),
+            headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual('gzip', gzip_resp.headers['Content-Encoding'])
+        data = gzip.GzipFile(fileobj=io.BytesIO(gzip_resp.data)).read()
+        self.assertEqual(resp, data.decode('utf-8'))
         self.logout()
 
     def test_public_user_dashboard_access(self):
@@ -5,6 +5,8 @@ from __future__ import unicode_literals
 
 import unittest
 
+import mock
+
 from superset import db_engine_specs
 
 
@@ -85,3 +87,18 @@ class DbEngineSpecsTestCase(unittest.TestCase):
             17/02/07 19:16:09 INFO exec.Task: 2017-02-07 19:16:09,173 Stage-1 map = 40%,  reduce = 0%
         """
         self.assertEquals(60, db_engine_specs.HiveEngineSpec.progress(log))
+
+    def test_fetch_data_chunks(self):
+        cursor = mock.Mock()
+        cursor.fetchmany.side_effect = [[1, 2], [3, 4], [5]]
+        chunks = db_engine_specs.BaseEngineSpec.fetch_data_chunks(
+            cursor, 5, 2)
+        self.assertEqual([[1, 2], [3, 4], [5]], list(chunks))
+        self.assertEqual(
+            [mock.call(2), mock.call(2), mock.call(1)],
+            cursor.fetchmany.call_args_list)
+
+        cursor.description = None
+        chunks = db_engine_specs.BaseEngineSpec.fetch_data_chunks(
+            cursor, 5, 2)
+        self.assertEqual([], list(chunks))
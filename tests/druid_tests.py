@@ -6,13 +6,18 @@ from __future__ import unicode_literals
 
 from datetime import datetime
 import json
+import os
+import threading
 import unittest
 
 from mock import Mock, patch
+from six.moves import BaseHTTPServer, socketserver
+from werkzeug.contrib.cache import SimpleCache
 
-from superset import db, sm, security
-from superset.connectors.druid.models import DruidCluster, DruidDatasource
-from superset.connectors.druid.models import PyDruid
+from superset import app, db, sm, security
+from superset.connectors.druid.models import (
+    DruidCluster, DruidColumn, DruidDatasource, Filter, Query, results_to_df)
+from superset.connectors.druid.models import PyDruid  # noqa
 
 from .base_tests import SupersetTestCase
 
@@ -64,6 +69,47 @@ GB_RESULT_SET = [
 ]
 
 
+class StubDruidHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Answers the coordinator and broker calls, keeping connections alive"""
+
+    protocol_version = 'HTTP/1.1'
+    responses = {
+        '/status': {'version': '0.9.1'},
+        '/druid/coordinator/v1/metadata/datasources': ['test_datasource'],
+        '/druid/v2': GB_RESULT_SET,
+    }
+
+    def respond(self, response=None):
+        self.server.client_ports.append(self.client_address[1])
+        if response is None:
+            response = self.responses[self.path]
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.respond()
+
+    def do_DELETE(self):
+        self.server.cancelled.append(self.path)
+        self.respond({})
+
+    def log_message(self, *args):
+        pass
+
+
+class StubDruidServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
 class DruidTests(SupersetTestCase):
 
     """Testing interactions with Druid"""
@@ -71,7 +117,7 @@ class DruidTests(SupersetTestCase):
     def __init__(self, *args, **kwargs):
         super(DruidTests, self).__init__(*args, **kwargs)
 
-    @patch('superset.connectors.druid.models.PyDruid')
+    @patch('superset.connectors.druid.models.DruidClient')
     def test_client(self, PyDruid):
         self.login(username='admin')
         instance = PyDruid.return_value
@@ -104,6 +150,15 @@ class DruidTests(SupersetTestCase):
         cluster.refresh_datasources(merge_flag=True)
         datasource_id = cluster.datasources[0].id
         db.session.commit()
+        datasource = cluster.datasources[0]
+        self.assertEqual(
+            {'__time', 'dim1', 'dim2', 'metric1'},
+            {col.column_name for col in datasource.columns})
+        self.assertEqual(
+            ['count'], [metric.metric_name for metric in datasource.metrics])
+        dim1 = [
+            col for col in datasource.columns if col.column_name == 'dim1'][0]
+        self.assertTrue(dim1.groupby)
 
         nres = [
             list(v['event'].items()) + [('timestamp', v['timestamp'])]
@@ -158,6 +213,384 @@ class DruidTests(SupersetTestCase):
         resp = self.get_json_resp(url)
         self.assertEqual("Canada", resp['data']['records'][0]['dim1'])
 
+    def test_http_session(self):
+        server = StubDruidServer(('localhost', 0), StubDruidHandler)
+        server.client_ports = []
+        server.cancelled = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            port = server.server_address[1]
+            cluster = DruidCluster(
+                cluster_name='stub_cluster',
+                coordinator_host='localhost',
+                coordinator_port=port,
+                coordinator_endpoint='druid/coordinator/v1/metadata',
+                broker_host='localhost',
+                broker_port=port,
+                broker_endpoint='druid/v2')
+            self.assertEqual('0.9.1', cluster.get_druid_version())
+            self.assertEqual(['test_datasource'], cluster.get_datasources())
+            for _ in range(2):
+                query = cluster.get_pydruid_client().groupby(
+                    datasource='test_datasource',
+                    granularity='all',
+                    intervals='2012-01-01/2012-01-02',
+                    dimensions=['dim1'],
+                    aggregations={})
+                self.assertEqual(GB_RESULT_SET, query.result)
+            datasource = DruidDatasource(
+                datasource_name='test_datasource', cluster=cluster)
+            datasource.cancel_query('superset_1')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(['/druid/v2/superset_1'], server.cancelled)
+        # all the calls went through a single kept alive connection
+        self.assertEqual(5, len(server.client_ports))
+        self.assertEqual(1, len(set(server.client_ports)))
+        self.assertIs(cluster.http_session, cluster.http_session)
+        other = DruidCluster(cluster_name='other_stub_cluster')
+        self.assertIsNot(cluster.http_session, other.http_session)
+        # a forked process doesn't reuse the connections of its parent
+        session = cluster.http_session
+        with patch('superset.connectors.druid.models.os.getpid',
+                   return_value=os.getpid() + 1):
+            self.assertIsNot(session, cluster.http_session)
+        self.assertIs(session, cluster.http_session)
+
+    def test_get_filters(self):
+        cluster = DruidCluster(cluster_name='filters', druid_version='0.9.2')
+        datasource = DruidDatasource(datasource_name='ds', cluster=cluster)
+        datasource.columns = [
+            DruidColumn(column_name='dim', type='STRING'),
+            DruidColumn(column_name='num', type='LONG'),
+        ]
+        raw_filters = [
+            {'col': 'dim', 'op': 'in', 'val': ["'a'", "'b'"]},
+            {'col': 'dim', 'op': '!=', 'val': 'c'},
+            {'col': 'num', 'op': '>=', 'val': '5'},
+            {'col': 'dim', 'op': 'not in', 'val': []},
+        ]
+        self.assertEqual({
+            'type': 'and',
+            'fields': [
+                {'type': 'in', 'dimension': 'dim', 'values': ['a', 'b']},
+                {
+                    'type': 'not',
+                    'field': {
+                        'type': 'selector', 'dimension': 'dim', 'value': 'c'},
+                },
+                {
+                    'type': 'bound',
+                    'dimension': 'num',
+                    'lower': '5',
+                    'lowerStrict': False,
+                    'upper': None,
+                    'upperStrict': False,
+                    'alphaNumeric': True,
+                },
+            ],
+        }, Filter.build_filter(datasource.get_filters(raw_filters)))
+
+        # older clusters get selectors and javascript filters instead
+        cluster.druid_version = '0.8.3'
+        self.assertEqual({
+            'type': 'and',
+            'fields': [
+                {
+                    'type': 'or',
+                    'fields': [
+                        {'type': 'selector', 'dimension': 'dim', 'value': 'a'},
+                        {'type': 'selector', 'dimension': 'dim', 'value': 'b'},
+                    ],
+                },
+                {
+                    'type': 'javascript',
+                    'dimension': 'num',
+                    'function': 'function(x) { return parseFloat(x) >= 5; }',
+                },
+            ],
+        }, Filter.build_filter(datasource.get_filters(
+            [raw_filters[0], raw_filters[2]])))
+
+    def test_get_rows_filter(self):
+        cluster = DruidCluster(cluster_name='filters', druid_version='0.9.2')
+        datasource = DruidDatasource(datasource_name='ds', cluster=cluster)
+        rows = [['a', 1], ['a', 2], ['b', float('nan')]]
+        self.assertEqual({
+            'type': 'or',
+            'fields': [
+                {
+                    'type': 'and',
+                    'fields': [
+                        {'type': 'selector', 'dimension': 'd1', 'value': 'a'},
+                        {'type': 'in', 'dimension': 'd2', 'values': [1, 2]},
+                    ],
+                },
+                {
+                    'type': 'and',
+                    'fields': [
+                        {'type': 'selector', 'dimension': 'd1', 'value': 'b'},
+                        {'type': 'selector', 'dimension': 'd2', 'value': None},
+                    ],
+                },
+            ],
+        }, Filter.build_filter(
+            datasource.get_rows_filter(['d1', 'd2'], rows)))
+        self.assertEqual(
+            {'type': 'in', 'dimension': 'd1', 'values': ['a', 'b']},
+            Filter.build_filter(
+                datasource.get_rows_filter(['d1'], [['a'], ['b']])))
+
+    def test_query_context(self):
+        cluster = DruidCluster(
+            cluster_name='context',
+            query_context='{"timeout": 60000, "priority": 1}')
+        datasource = DruidDatasource(
+            datasource_name='ds', cluster=cluster,
+            query_context='{"priority": 2}')
+        self.assertEqual(
+            {'timeout': 60000, 'priority': 2}, datasource.get_query_context())
+        self.assertEqual({
+            'timeout': 60000,
+            'priority': 3,
+            'useCache': False,
+            'queryId': 'superset_1',
+        }, datasource.get_query_context(
+            '{"priority": 3, "useCache": false}', 'superset_1'))
+
+    def test_phase_one_rows_cache(self):
+        cluster = DruidCluster(cluster_name='phase_one')
+        datasource = DruidDatasource(datasource_name='ds', cluster=cluster)
+        client = Mock()
+        client.groupby.return_value.result = GB_RESULT_SET
+        cache = SimpleCache()
+        with patch(
+                'superset.connectors.druid.models.query_results_cache', cache):
+            for _ in range(2):
+                rows = datasource.get_phase_one_rows(
+                    client, {}, {'queryType': 'groupBy'}, ['dim1'])
+                self.assertEqual([['Canada'], ['USA']], rows)
+            self.assertEqual(1, client.groupby.call_count)
+
+            datasource.get_phase_one_rows(
+                client, {}, {'queryType': 'groupBy', 'filter': {}}, ['dim1'])
+            self.assertEqual(2, client.groupby.call_count)
+
+            # windows ending now share their series until the next hour
+            for now in ('10:05:12', '10:35:47'):
+                datasource.get_phase_one_rows(client, {}, {
+                    'queryType': 'groupBy',
+                    'intervals': '2012-01-01T10:00:00/2012-01-02T' + now,
+                }, ['dim1'], 'hour')
+            self.assertEqual(3, client.groupby.call_count)
+            datasource.get_phase_one_rows(client, {}, {
+                'queryType': 'groupBy',
+                'intervals': '2012-01-01T11:00:00/2012-01-02T11:00:00',
+            }, ['dim1'], 'hour')
+            self.assertEqual(4, client.groupby.call_count)
+
+            # a forced refresh runs phase one again and caches its rows
+            client.groupby.return_value.result = GB_RESULT_SET[:1]
+            rows = datasource.get_phase_one_rows(
+                client, {}, {'queryType': 'groupBy'}, ['dim1'], force=True)
+            self.assertEqual([['Canada']], rows)
+            self.assertEqual(5, client.groupby.call_count)
+            rows = datasource.get_phase_one_rows(
+                client, {}, {'queryType': 'groupBy'}, ['dim1'])
+            self.assertEqual([['Canada']], rows)
+            self.assertEqual(5, client.groupby.call_count)
+
+    def test_parse_timestamps(self):
+        timestamps = [
+            '2012-01-01T00:00:00.000Z', '2012-01-01T00:00:00.000-08:00']
+        self.assertEqual(
+            [datetime(2012, 1, 1), datetime(2012, 1, 1, 8)],
+            list(DruidDatasource.parse_timestamps(timestamps)))
+        self.assertEqual(
+            [datetime(2012, 1, 7), datetime(2012, 1, 7, 8)],
+            list(DruidDatasource.parse_timestamps(
+                timestamps,
+                DruidDatasource.time_offset('week_ending_saturday'))))
+
+    def test_results_to_df(self):
+        topn_result = [{
+            'timestamp': '2012-01-01T00:00:00.000Z',
+            'result': [
+                {'dim1': 'Canada', 'metric1': 2},
+                {'dim1': None, 'metric1': 1},
+            ],
+        }]
+        ts_result = [{
+            'timestamp': '2012-01-01T00:00:00.000Z',
+            'result': {'metric1': 3},
+        }]
+        for query_type, result in (
+                ('groupBy', GB_RESULT_SET),
+                ('topN', topn_result),
+                ('timeseries', ts_result)):
+            query = Query({}, query_type)
+            query.parse(json.dumps(result))
+            expected = query.export_pandas()
+            df = results_to_df(query)
+            self.assertEqual(list(expected.columns), list(df.columns))
+            self.assertEqual(
+                expected.drop('timestamp', axis=1).values.tolist(),
+                df.drop('timestamp', axis=1).values.tolist())
+            self.assertEqual(
+                [datetime(2012, 1, 1)] * len(df), list(df['timestamp']))
+
+        query = Query({}, 'groupBy')
+        query.parse('[]')
+        self.assertIsNone(results_to_df(query))
+
+    def test_get_split_intervals(self):
+        query_obj = {
+            'from_dttm': datetime(2017, 1, 15, 12),
+            'to_dttm': datetime(2017, 3, 20),
+            'groupby': ['dim1'],
+            'timeseries_limit': 0,
+        }
+        self.assertEqual(
+            [], DruidDatasource.get_split_intervals(query_obj))
+        with patch.dict(app.config, {'DRUID_QUERY_SPLIT_DAYS': 30}):
+            self.assertEqual([
+                '2017-01-15T12:00:00+00:00/2017-02-14T00:00:00+00:00',
+                '2017-02-14T00:00:00+00:00/2017-03-16T00:00:00+00:00',
+                '2017-03-16T00:00:00+00:00/2017-03-20T00:00:00+00:00',
+            ], DruidDatasource.get_split_intervals(query_obj))
+            # the first phase of the query runs over the whole interval
+            query_obj['timeseries_limit'] = 10
+            self.assertEqual(
+                [], DruidDatasource.get_split_intervals(query_obj))
+
+    def test_query_time_slice_offset(self):
+        cluster = DruidCluster(cluster_name='time_offset')
+        datasource = DruidDatasource(
+            datasource_name='test_datasource', cluster=cluster)
+        query_obj = {
+            'granularity': 'week_ending_saturday',
+            'from_dttm': datetime(2012, 1, 1),
+            'to_dttm': datetime(2012, 1, 8),
+            'groupby': ['dim1'],
+            'metrics': ['metric1'],
+            'extras': {},
+        }
+        query = Query({}, 'groupBy')
+        query.parse(json.dumps(GB_RESULT_SET))
+        client = Mock()
+        client.export_pandas.return_value = results_to_df(query)
+        with patch.object(
+                DruidCluster, 'get_pydruid_client', return_value=client), \
+                patch.object(datasource, 'get_query_str'), \
+                patch.object(DruidDatasource, 'parse_timestamps') as parse:
+            df = datasource.query_time_slice(query_obj).df
+        # the timestamps parsed with the results are only shifted
+        self.assertFalse(parse.called)
+        self.assertEqual(
+            [datetime(2012, 1, 7)] * 2, list(df['__timestamp']))
+
+    def test_run_split_query(self):
+        datasource = DruidDatasource(datasource_name='test_datasource')
+        query_obj = {
+            'granularity': 'all',
+            'is_timeseries': False,
+            'groupby': ['dim1'],
+            'extras': {},
+        }
+        intervals = ['2012-01-01/2012-02-01', '2012-02-01/2012-03-01']
+        aggregations = {'metric1': {'type': 'longSum', 'fieldName': 'metric1'}}
+
+        def get_query_str(client, qry_start_dttm, **kwargs):
+            client.groupby(
+                datasource='test_datasource', granularity='all',
+                intervals='2012-01-01/2012-03-01', dimensions=['dim1'],
+                aggregations=aggregations)
+            return 'query'
+
+        def post(query):
+            # rows are stamped with the start of their sub-interval
+            start = query.query_dict['intervals'].split('/')[0]
+            query.parse(json.dumps([
+                dict(row, timestamp=start + 'T00:00:00.000Z')
+                for row in GB_RESULT_SET]))
+            return query
+
+        client = Mock(url='http://localhost:7980/', endpoint='druid/v2')
+        client._post.side_effect = post
+        with patch.object(
+                datasource, 'get_query_str', side_effect=get_query_str):
+            query_str, df = datasource.run_split_query(
+                client, datetime.now(), query_obj, intervals)
+            self.assertEqual(intervals, sorted(
+                args[0].query_dict['intervals']
+                for args, _ in client._post.call_args_list))
+            # the sums of the sub-intervals are added up
+            self.assertEqual(2, len(df))
+            self.assertEqual(
+                {'Canada': 2 * 12345678, 'USA': 12345678},
+                dict(zip(df['dim1'], df['metric1'])))
+            self.assertEqual(
+                [datetime(2012, 1, 1)] * 2, list(df['timestamp']))
+
+            # distinct counts don't add up, the query runs at once
+            client._post.reset_mock()
+            aggregations['metric1']['type'] = 'hyperUnique'
+            query_str, df = datasource.run_split_query(
+                client, datetime.now(), query_obj, intervals)
+            self.assertEqual(1, client._post.call_count)
+            self.assertEqual(
+                '2012-01-01/2012-03-01',
+                client._post.call_args[0][0].query_dict['intervals'])
+
+    def test_run_split_query_null_dimension(self):
+        datasource = DruidDatasource(datasource_name='test_datasource')
+        query_obj = {
+            'granularity': 'all',
+            'is_timeseries': False,
+            'groupby': ['dim1'],
+            'extras': {},
+        }
+        intervals = ['2012-01-01/2012-02-01', '2012-02-01/2012-03-01']
+        aggregations = {'metric1': {'type': 'longSum', 'fieldName': 'metric1'}}
+
+        def get_query_str(client, qry_start_dttm, **kwargs):
+            client.groupby(
+                datasource='test_datasource', granularity='all',
+                intervals='2012-01-01/2012-03-01', dimensions=['dim1'],
+                aggregations=aggregations)
+            return 'query'
+
+        def post(query):
+            # the null dimension values are left out of the events
+            query.parse(json.dumps([{
+                'version': 'v1',
+                'timestamp': '2012-01-01T00:00:00.000Z',
+                'event': {'dim1': 'Canada', 'metric1': 1},
+            }, {
+                'version': 'v1',
+                'timestamp': '2012-01-01T00:00:00.000Z',
+                'event': {'metric1': 2},
+            }]))
+            return query
+
+        client = Mock(url='http://localhost:7980/', endpoint='druid/v2')
+        client._post.side_effect = post
+        with patch.object(
+                datasource, 'get_query_str', side_effect=get_query_str):
+            _, split_df = datasource.run_split_query(
+                client, datetime.now(), query_obj, intervals)
+            aggregations['metric1']['type'] = 'hyperUnique'
+            _, df = datasource.run_split_query(
+                client, datetime.now(), query_obj, intervals)
+        self.assertEqual(3, client._post.call_count)
+        self.assertEqual(['Canada', None], list(df['dim1']))
+        self.assertEqual(list(df['dim1']), list(split_df['dim1']))
+        self.assertEqual([2, 4], list(split_df['metric1']))
+
     def test_druid_sync_from_config(self):
         CLUSTER_NAME = 'new_druid'
         self.login()
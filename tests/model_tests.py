@@ -1,8 +1,11 @@
 import unittest
 
+from mock import patch
 from sqlalchemy.engine.url import make_url
 
-from superset.models.core import Database
+from superset.db_engine_specs import (
+    BaseEngineSpec, HiveEngineSpec, PostgresEngineSpec, PrestoEngineSpec)
+from superset.models.core import Database, engine_registry
 
 
 class DatabaseModelTestCase(unittest.TestCase):
@@ -46,3 +49,41 @@ class DatabaseModelTestCase(unittest.TestCase):
         assert db == 'superset'
         db = model.get_database_for_various_backend(url, 'adhoc')
         assert db == 'adhoc'
+
+    def test_get_sqla_engine_is_pooled(self):
+        model = Database(id=9999, sqlalchemy_uri='sqlite://')
+        engine = model.get_sqla_engine()
+        self.assertIs(engine, model.get_sqla_engine())
+        self.assertIsNot(engine, model.get_sqla_engine(schema='main'))
+
+        # editing the uri or the engine params swaps the engine
+        model.extra = '{"engine_params": {"echo": true}}'
+        new_engine = model.get_sqla_engine()
+        self.assertIsNot(engine, new_engine)
+        self.assertTrue(new_engine.echo)
+
+        engine_registry.invalidate(model.id)
+        self.assertIsNot(new_engine, model.get_sqla_engine())
+
+        # transient objects don't go through the registry
+        model = Database(sqlalchemy_uri='sqlite://')
+        self.assertIsNot(model.get_sqla_engine(), model.get_sqla_engine())
+
+    @patch('superset.models.core.create_engine')
+    def test_db_engine_spec_from_uri(self, create_engine):
+        model = Database(sqlalchemy_uri='presto://presto.airbnb.io:8080/hive')
+        self.assertIs(PrestoEngineSpec, model.db_engine_spec)
+        self.assertIs(PrestoEngineSpec, model.db_engine_spec)
+
+        model.sqlalchemy_uri = 'hive://hive@hive.airbnb.io:10000/raw_data'
+        self.assertIs(HiveEngineSpec, model.db_engine_spec)
+
+        model.sqlalchemy_uri = 'postgresql+psycopg2://pg.airbnb.io/prod'
+        self.assertIs(PostgresEngineSpec, model.db_engine_spec)
+
+        model.sqlalchemy_uri = 'postgres://superset@pg.airbnb.io/prod'
+        self.assertIs(PostgresEngineSpec, model.db_engine_spec)
+
+        model.sqlalchemy_uri = 'unknowndb://somewhere/prod'
+        self.assertIs(BaseEngineSpec, model.db_engine_spec)
+        self.assertFalse(create_engine.called)
@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import pandas as pd
+
+from superset import serialization, utils
+
+
+class SerializationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'name': ['Aaron', 'Amy', None],
+            'num': [1, 2, 3],
+            'ratio': [.5, None, 1.5],
+        })
+
+    def test_payload(self):
+        payload = json.dumps({'status': 'success'})
+        blob = serialization.serialize(payload)
+        self.assertEqual((payload, None), serialization.deserialize(blob))
+
+    def test_legacy_payload(self):
+        payload = json.dumps({'status': 'success'})
+        blob = utils.zlib_compress(payload)
+        self.assertEqual((payload, None), serialization.deserialize(blob))
+
+    def test_df_round_trip(self):
+        for fmt in serialization.FORMATS:
+            for compressor in serialization.COMPRESSORS:
+                blob = serialization.serialize(
+                    '{}', self.df, fmt=fmt, compressor=compressor)
+                payload, df = serialization.deserialize(blob)
+                self.assertEqual('{}', payload)
+                self.assertEqual(list(self.df.columns), list(df.columns))
+                self.assertEqual(
+                    self.df.fillna(0).values.tolist(),
+                    df.fillna(0).values.tolist())
+
+    def test_unavailable_format(self):
+        blob = serialization.serialize(
+            '{}', self.df, fmt='unknown', compressor='unknown')
+        self.assertTrue(blob.startswith(serialization.MAGIC + b'msgpack:zlib'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,8 +8,12 @@ from datetime import datetime, timedelta
 import json
 import unittest
 
+import mock
 from flask_appbuilder.security.sqla import models as ab_models
-from superset import db, utils, appbuilder, sm
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import db, utils, appbuilder, sm, serialization, sql_lab
+from superset.db_engine_specs import BaseEngineSpec
 from superset.models import core as models
 
 from .base_tests import SupersetTestCase
@@ -52,6 +56,81 @@ class SqlLabTests(SupersetTestCase):
         data = self.run_sql('SELECT * FROM unexistant_table', "2")
         self.assertLess(0, len(data['error']))
 
+    def test_store_results_pages(self):
+        self.run_sql(
+            "SELECT * FROM ab_user", client_id='client_id_pages',
+            user_name='admin')
+        query = db.session.query(models.Query).filter_by(
+            client_id='client_id_pages').one()
+        running = utils.QueryStatus.RUNNING
+        query.status = running
+        results_backend = SimpleCache()
+        published = []
+
+        def fetchmany(unused_size):
+            if query.results_key:
+                payload = json.loads(serialization.deserialize(
+                    results_backend.get(query.results_key))[0])
+                published.append((payload['status'], payload['pages']))
+            return pages.pop(0)
+
+        pages = [
+            [(1, 'a', None), (2, 'b', None)], [(3, 'c', '2017-01-01')], []]
+        cursor = mock.Mock()
+        cursor.description = [('id', None), ('name', None), ('ds', None)]
+        cursor.fetchmany.side_effect = fetchmany
+        with mock.patch('superset.sql_lab.results_backend', results_backend):
+            columns = sql_lab.store_results_pages(
+                query, db.session, cursor, BaseEngineSpec, 2)
+            # published from the first page on, while the query runs
+            self.assertEqual(
+                [(running, 1), (running, 2)],
+                published)
+            self.assertEqual(
+                ['id', 'name', 'ds'], [c['name'] for c in columns])
+            # the dates are only on the second page
+            self.assertEqual('datetime_string', columns[2]['type'])
+            self.assertEqual(2, query.results_pages)
+            self.assertEqual(3, query.rows)
+            df = sql_lab.concat_results_pages(query.results_key, 0, 2)
+            self.assertEqual(['a', 'b', 'c'], list(df['name']))
+
+            # reading a slice of the results, across pages
+            sql_lab.store_results_payload(query, {'columns': columns})
+            payload = json.loads(serialization.deserialize(
+                results_backend.get(query.results_key))[0])
+            df = sql_lab.get_results_slice(
+                query.results_key, payload, offset=1, limit=2)
+            self.assertEqual(['b', 'c'], list(df['name']))
+
+            db.session.commit()
+            with mock.patch(
+                    'superset.views.core.results_backend', results_backend):
+                self.login('admin')
+                resp = self.get_json_resp(
+                    '/superset/results/{}/?offset=1&limit=1&columns=name'
+                    .format(query.results_key))
+                self.assertEqual([{'name': 'b'}], resp['data'])
+                self.assertEqual(['name'], [c['name'] for c in resp['columns']])
+                for params in ('offset=-1', 'limit=-1'):
+                    resp = self.client.get('/superset/results/{}/?{}'.format(
+                        query.results_key, params))
+                    self.assertEqual(400, resp.status_code)
+
+            # no rows, the columns still come from the cursor
+            cursor.fetchmany.side_effect = [[]]
+            columns = sql_lab.store_results_pages(
+                query, db.session, cursor, BaseEngineSpec, 2)
+            self.assertEqual(0, query.results_pages)
+            self.assertEqual(
+                ['id', 'name', 'ds'], [c['name'] for c in columns])
+            sql_lab.store_results_payload(query, {'columns': columns})
+            db.session.commit()
+            with mock.patch(
+                    'superset.views.core.results_backend', results_backend):
+                resp = self.get_resp('/superset/csv/client_id_pages')
+                self.assertEqual('id,name,ds', resp.strip())
+
     def test_sql_json_has_access(self):
         main_db = self.get_main_database(db.session)
         sm.add_permission_view_menu('database_access', main_db.perm)
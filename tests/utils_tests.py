@@ -1,14 +1,18 @@
 from datetime import datetime, date, timedelta, time
 from decimal import Decimal
+from superset.cache_util import acquire_lock, release_lock
 from superset.utils import (
-    json_int_dttm_ser, json_iso_dttm_ser, base_json_conv, parse_human_timedelta, zlib_compress,
+    df_chunks_to_csv, json_int_dttm_ser, json_iso_dttm_ser, base_json_conv, parse_human_timedelta, zlib_compress,
     zlib_uncompress_to_string
 )
 import unittest
 import uuid
+import zlib
 
 from mock import Mock, patch
 import numpy
+import pandas as pd
+from werkzeug.contrib.cache import SimpleCache
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -57,3 +61,30 @@ class UtilsTestCase(unittest.TestCase):
         blob = zlib_compress(byte_str)
         got_str = zlib_uncompress_to_string(blob)
         self.assertEquals(json_str, got_str)
+
+    def test_cache_lock(self):
+        cache = SimpleCache()
+        token = acquire_lock(cache, 'key', timeout=10)
+        self.assertTrue(token)
+        self.assertIsNone(acquire_lock(cache, 'key', timeout=10))
+
+        # only the holder of the lock can release it
+        release_lock(cache, 'key', 'not_the_token')
+        self.assertIsNone(acquire_lock(cache, 'key', timeout=10))
+        release_lock(cache, 'key', token)
+        self.assertTrue(acquire_lock(cache, 'key', timeout=10))
+
+    def test_df_chunks_to_csv(self):
+        chunks = [
+            pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}, columns=['a', 'b']),
+            pd.DataFrame({'a': [3], 'b': ['z']}, columns=['a', 'b']),
+        ]
+        csv = b''.join(df_chunks_to_csv(chunks, columns=['a', 'b']))
+        self.assertEqual(b'a,b\n1,x\n2,y\n3,z\n', csv)
+
+        # the header is still written when there are no rows
+        self.assertEqual(
+            b'a,b\n', b''.join(df_chunks_to_csv([], columns=['a', 'b'])))
+        blob = b''.join(df_chunks_to_csv([], True, ['a', 'b']))
+        self.assertEqual(
+            b'a,b\n', zlib.decompress(blob, 16 + zlib.MAX_WBITS))